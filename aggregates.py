@@ -0,0 +1,239 @@
+import os
+
+import pandas as pd
+
+from anomalies import DEFAULT_FREQUENCY, FREQUENCIES, ErrorRateMonitor, detect_error_anomalies
+from reconciliation import reconcile_balances
+from request_index import build_request_index, lookup_transactions
+from schema import plain_values
+from sketches import HeavyHitters, HyperLogLog
+
+CUBE_DIR = 'aggregate_cube'
+DEFAULT_TOP_K = 1000
+
+
+def _value_counts(values, key):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Counting the codes keeps ties in order of first appearance, as for plain values
+        codes = pd.Series(values.cat.codes)
+        counts = codes[codes >= 0].value_counts()
+        counts.index = values.cat.categories.take(counts.index)
+        return counts.rename_axis(key).reset_index(name='count')
+    return values.value_counts().rename_axis(key).reset_index(name='count')
+
+
+def build_aggregate_cube(parsed_df=None, error_df=None, user_analysis_df=None, request_index=None,
+                         anomaly_frequency=DEFAULT_FREQUENCY, reconcile=True):
+    """Aggregate the parsed frames once into the compact tables every chart is drawn from.
+
+    Any frame can be omitted, in which case the tables derived from it are left out. Errors are
+    attributed to actions through request_index, which is built from parsed_df if not given. The
+    error_rate table scores error counts per anomaly_frequency bucket; None leaves it out. With
+    reconcile, the balance_breaks table lists the breaks in the users' balance chains.
+    """
+    cube = {}
+
+    if parsed_df is not None:
+        dates = parsed_df['timestamp'].dt.date
+        daily = (parsed_df.groupby([dates, parsed_df['type'], parsed_df['action']], dropna=False, observed=True)
+                 .size().rename_axis(['date', 'type', 'action']).reset_index(name='count'))
+        daily['type'], daily['action'] = plain_values(daily['type']), plain_values(daily['action'])
+        cube['daily_transactions'] = daily[daily['date'].notna()]
+        cube['action_transactions'] = _value_counts(parsed_df['action'], 'action')
+        cube['user_transactions'] = _value_counts(parsed_df['userId'], 'userId')
+        if reconcile:
+            cube['balance_breaks'] = reconcile_balances(parsed_df)
+
+    if error_df is not None:
+        cube['daily_errors'] = (error_df.groupby(error_df['timestamp'].dt.date).size()
+                                .rename_axis('date').reset_index(name='count'))
+        cube['user_errors'] = _value_counts(error_df['userId'], 'userId')
+        if anomaly_frequency is not None:
+            cube['error_rate'] = detect_error_anomalies(error_df['timestamp'], anomaly_frequency)
+
+    if error_df is not None and parsed_df is not None:
+        if request_index is None:
+            request_index = build_request_index(parsed_df)
+        error_actions = lookup_transactions(request_index, error_df['request_id'])['action']
+        cube['error_actions'] = _value_counts(error_actions, 'action')
+
+    if user_analysis_df is not None:
+        cube['losses'] = pd.DataFrame({
+            'Total_debit_loss': [user_analysis_df['Total_debit_loss'].sum()],
+            'Total_credit_loss': [user_analysis_df['Total_credit_loss'].sum()],
+        })
+        reasons = user_analysis_df[user_analysis_df['First_error_transaction_reason'] != 'nan - nan']
+        cube['first_error_reasons'] = _value_counts(reasons['First_error_transaction_reason'],
+                                                    'First_error_transaction_reason')
+
+    return cube
+
+
+def _add_counts(table, other, keys):
+    if table is None:
+        return other
+    combined = pd.concat([table, other], ignore_index=True)
+    return combined.groupby(keys, dropna=False, sort=True)['count'].sum().reset_index()
+
+
+def _top_table(heavy_hitters, key):
+    top = heavy_hitters.top()
+    return pd.DataFrame({key: top.index.to_numpy(dtype=object), 'count': top.to_numpy()})
+
+
+def _table_to_dict(table):
+    if table is None:
+        return None
+    return table.assign(date=table['date'].astype(str)).to_dict('list')
+
+
+def _table_from_dict(data):
+    if data is None:
+        return None
+    table = pd.DataFrame(data)
+    table['date'] = pd.to_datetime(table['date']).dt.date
+    return table
+
+
+# StreamingSummary attributes holding sketches, with their classes
+SKETCHES = {
+    'actions': HeavyHitters,
+    'transaction_users': HeavyHitters,
+    'error_users': HeavyHitters,
+    'distinct_users': HyperLogLog,
+    'distinct_error_users': HyperLogLog,
+}
+
+
+class StreamingSummary:
+    """Memory-bounded, mergeable aggregates folded from parsed chunks one at a time.
+
+    Daily counts are exact. Per-user and per-action counts keep only the top_k heaviest items
+    (Space-Saving with Count-Min estimates), and distinct users are counted with HyperLogLog, so
+    memory does not grow with the number of rows or users. Error counts per anomaly_frequency
+    bucket are kept exactly and scored by an ErrorRateMonitor in to_cube(). Summaries built by
+    separate workers merge into the summary of all their chunks. The cube from to_cube() has the
+    tables the top-N, daily and error rate charts need, plus a totals table; error attribution and
+    losses need the full frames.
+    """
+
+    def __init__(self, top_k=DEFAULT_TOP_K, anomaly_frequency=DEFAULT_FREQUENCY):
+        self.top_k = top_k
+        self.anomaly_frequency = anomaly_frequency
+        self.error_buckets = pd.Series(dtype='int64')
+        self.transactions = 0
+        self.errors = 0
+        self.daily_transactions = None
+        self.daily_errors = None
+        self.actions = HeavyHitters(top_k)
+        self.transaction_users = HeavyHitters(top_k)
+        self.error_users = HeavyHitters(top_k)
+        self.distinct_users = HyperLogLog()
+        self.distinct_error_users = HyperLogLog()
+
+    def update(self, parsed_df=None, error_df=None):
+        """Fold one chunk of transaction and error rows into the summary"""
+        if parsed_df is not None and not parsed_df.empty:
+            chunk = build_aggregate_cube(parsed_df=parsed_df, anomaly_frequency=None, reconcile=False)
+            self.transactions += len(parsed_df)
+            self.daily_transactions = _add_counts(self.daily_transactions, chunk['daily_transactions'],
+                                                  ['date', 'type', 'action'])
+            self.actions.add(counts(chunk, 'action_transactions', 'action'))
+            self.transaction_users.add(counts(chunk, 'user_transactions', 'userId'))
+            self.distinct_users.add(chunk['user_transactions']['userId'])
+        if error_df is not None and not error_df.empty:
+            chunk = build_aggregate_cube(error_df=error_df, anomaly_frequency=None)
+            self.errors += len(error_df)
+            buckets = error_df['timestamp'].dropna().dt.floor(FREQUENCIES[self.anomaly_frequency]).value_counts()
+            self.error_buckets = self.error_buckets.add(buckets, fill_value=0).astype('int64')
+            self.daily_errors = _add_counts(self.daily_errors, chunk['daily_errors'], ['date'])
+            self.error_users.add(counts(chunk, 'user_errors', 'userId'))
+            self.distinct_error_users.add(chunk['user_errors']['userId'])
+        return self
+
+    def merge(self, other):
+        if other.anomaly_frequency != self.anomaly_frequency:
+            raise ValueError("Summaries with different anomaly frequencies cannot be merged")
+        self.transactions += other.transactions
+        self.errors += other.errors
+        self.error_buckets = self.error_buckets.add(other.error_buckets, fill_value=0).astype('int64')
+        if other.daily_transactions is not None:
+            self.daily_transactions = _add_counts(self.daily_transactions, other.daily_transactions,
+                                                  ['date', 'type', 'action'])
+        if other.daily_errors is not None:
+            self.daily_errors = _add_counts(self.daily_errors, other.daily_errors, ['date'])
+        for name in SKETCHES:
+            getattr(self, name).merge(getattr(other, name))
+        return self
+
+    def to_dict(self):
+        """JSON-serializable state, so a running summary can be persisted between runs"""
+        return {
+            'top_k': self.top_k,
+            'anomaly_frequency': self.anomaly_frequency,
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'error_buckets': {bucket.isoformat(): int(count) for bucket, count in self.error_buckets.items()},
+            'daily_transactions': _table_to_dict(self.daily_transactions),
+            'daily_errors': _table_to_dict(self.daily_errors),
+            **{name: getattr(self, name).to_dict() for name in SKETCHES},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data['top_k'], data['anomaly_frequency'])
+        summary.transactions = data['transactions']
+        summary.errors = data['errors']
+        summary.error_buckets = pd.Series(list(data['error_buckets'].values()),
+                                          index=pd.to_datetime(list(data['error_buckets']), utc=True), dtype='int64')
+        summary.daily_transactions = _table_from_dict(data['daily_transactions'])
+        summary.daily_errors = _table_from_dict(data['daily_errors'])
+        for name, sketch in SKETCHES.items():
+            setattr(summary, name, sketch.from_dict(data[name]))
+        return summary
+
+    def to_cube(self):
+        empty_daily = pd.DataFrame({'date': [], 'count': []})
+        monitor = ErrorRateMonitor(self.anomaly_frequency, max_history=None)
+        monitor.add_counts(self.error_buckets.sort_index())
+        monitor.flush()
+        return {
+            'daily_transactions': (self.daily_transactions if self.daily_transactions is not None
+                                   else empty_daily.assign(type=[], action=[])),
+            'daily_errors': self.daily_errors if self.daily_errors is not None else empty_daily,
+            'action_transactions': _top_table(self.actions, 'action'),
+            'user_transactions': _top_table(self.transaction_users, 'userId'),
+            'user_errors': _top_table(self.error_users, 'userId'),
+            'error_rate': monitor.table(),
+            'totals': pd.DataFrame({
+                'transactions': [self.transactions],
+                'error_transactions': [self.errors],
+                'distinct_users': [self.distinct_users.count()],
+                'distinct_error_users': [self.distinct_error_users.count()],
+            }),
+        }
+
+
+def counts(cube, table, key):
+    """Return a cube count table as a Series indexed by key, in stored order"""
+    return pd.Series(cube[table]['count'].to_numpy(), index=pd.Index(cube[table][key], name=key))
+
+
+def daily_transaction_counts(cube, transaction_type=None):
+    daily = cube['daily_transactions']
+    if transaction_type is not None:
+        daily = daily[daily['type'] == transaction_type]
+    return daily.groupby('date')['count'].sum()
+
+
+def save_aggregate_cube(cube, cube_dir):
+    os.makedirs(cube_dir, exist_ok=True)
+    for name, table in cube.items():
+        table.to_parquet(os.path.join(cube_dir, f"{name}.parquet"), index=False)
+
+
+def load_aggregate_cube(cube_dir):
+    return {
+        file_name[:-len('.parquet')]: pd.read_parquet(os.path.join(cube_dir, file_name))
+        for file_name in sorted(os.listdir(cube_dir)) if file_name.endswith('.parquet')
+    }
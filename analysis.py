@@ -1,23 +1,45 @@
+import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+import pandas as pd
 
+from anomalies import DEFAULT_FREQUENCY
+from aggregates import CUBE_DIR, build_aggregate_cube, counts, daily_transaction_counts, save_aggregate_cube
 from reports.excel_report import insert_chart_to_excel
 
 warnings.filterwarnings('ignore')
 
-# Set style for better looking charts
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
+ANOMALY_SHEET = "error_rate_anomalies"
+BALANCE_BREAKS_SHEET = "balance_breaks"
 
 
-def transaction_count_over_period(parsed_df, output_dir, output_file_name):
+@lru_cache(maxsize=None)
+def _pyplot():
+    """matplotlib.pyplot with the chart style applied, imported on first use so native charts never load it"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set style for better looking charts
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+    return plt
+
+
+def anomaly_threshold(daily_errors):
+    """Daily error count above which a day is flagged as an anomaly"""
+    return daily_errors.mean() + (2 * daily_errors.std())
+
+
+def transaction_count_over_period(parsed_df, output_dir, output_file_name, report=None, cube=None):
     """Transaction count over the period bar chart"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Group by date and count transactions
-    daily_transactions = parsed_df.groupby(parsed_df['timestamp'].dt.date).size()
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df)
+    daily_transactions = daily_transaction_counts(cube)
 
     plt.bar(daily_transactions.index, daily_transactions.values, alpha=0.7, color='skyblue')
     plt.title('Transaction Count Over Time', fontsize=16, fontweight='bold')
@@ -27,17 +49,19 @@ def transaction_count_over_period(parsed_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/transaction_count_over_period.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Transaction Analysis",
-                          output_dir + "/transaction_count_over_period.png", "B2")
+                          output_dir + "/transaction_count_over_period.png", "B2", report=report)
 
 
-def credit_transactions_over_period(parsed_df, output_dir, output_file_name):
+def credit_transactions_over_period(parsed_df, output_dir, output_file_name, report=None, cube=None):
     """Credit transactions over the period"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Filter credit transactions
-    credit_df = parsed_df[parsed_df['type'] == 'CREDIT']
-    daily_credits = credit_df.groupby(credit_df['timestamp'].dt.date).size()
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df)
+    daily_credits = daily_transaction_counts(cube, 'CREDIT')
 
     plt.bar(daily_credits.index, daily_credits.values, alpha=0.7, color='lightgreen')
     plt.title('Credit Transactions Over Time', fontsize=16, fontweight='bold')
@@ -47,17 +71,19 @@ def credit_transactions_over_period(parsed_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/credit_transactions_over_period.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Transaction Analysis",
-                          output_dir + "/credit_transactions_over_period.png", "B60")
+                          output_dir + "/credit_transactions_over_period.png", "B60", report=report)
 
 
-def debit_transactions_over_period(parsed_df, output_dir, output_file_name):
+def debit_transactions_over_period(parsed_df, output_dir, output_file_name, report=None, cube=None):
     """Debit transactions over the period"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Filter debit transactions
-    debit_df = parsed_df[parsed_df['type'] == 'DEBIT']
-    daily_debits = debit_df.groupby(debit_df['timestamp'].dt.date).size()
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df)
+    daily_debits = daily_transaction_counts(cube, 'DEBIT')
 
     plt.bar(daily_debits.index, daily_debits.values, alpha=0.7, color='lightcoral')
     plt.title('Debit Transactions Over Time', fontsize=16, fontweight='bold')
@@ -67,16 +93,19 @@ def debit_transactions_over_period(parsed_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/debit_transactions_over_period.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Transaction Analysis",
-                          output_dir + "/debit_transactions_over_period.png", "B118")
+                          output_dir + "/debit_transactions_over_period.png", "B118", report=report)
 
 
-def transactions_by_action_over_period(parsed_df, output_dir, output_file_name):
+def transactions_by_action_over_period(parsed_df, output_dir, output_file_name, report=None, cube=None):
     """Transaction count by action"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Get top 15 actions by count
-    action_counts = parsed_df['action'].value_counts().head(15)
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df)
+    action_counts = counts(cube, 'action_transactions', 'action').head(15)
 
     # Create horizontal bar chart
     plt.barh(range(len(action_counts)), action_counts.values, alpha=0.7, color='skyblue')
@@ -87,16 +116,19 @@ def transactions_by_action_over_period(parsed_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/transactions_by_action_over_period.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Transaction Analysis",
-                          output_dir + "/transactions_by_action_over_period.png", "B176")
+                          output_dir + "/transactions_by_action_over_period.png", "B176", report=report)
 
 
-def top_users_transacting(parsed_df, output_dir, output_file_name):
+def top_users_transacting(parsed_df, output_dir, output_file_name, report=None, cube=None):
     """Top users transacting"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Get top 10 users by transaction count
-    top_users = parsed_df['userId'].value_counts().head(10)
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df)
+    top_users = counts(cube, 'user_transactions', 'userId').head(10)
 
     plt.bar(range(len(top_users)), top_users.values, alpha=0.7, color='gold')
     plt.xticks(range(len(top_users)), top_users.index, rotation=45, ha="right")  # Set actual user IDs on the x-axis
@@ -106,21 +138,22 @@ def top_users_transacting(parsed_df, output_dir, output_file_name):
     plt.grid(True, axis='y', alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/top_users_transacting.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Transaction Analysis",
-                          output_dir + "/top_users_transacting.png", "B234")
+                          output_dir + "/top_users_transacting.png", "B234", report=report)
 
 
-def error_transactions_over_period(error_df, output_dir, output_file_name):
+def error_transactions_over_period(error_df, output_dir, output_file_name, report=None, cube=None):
     """Error transactions over the period with anomaly detection"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Group by date and count errors
-    daily_errors = error_df.groupby(error_df['timestamp'].dt.date).size()
+    cube = cube if cube is not None else build_aggregate_cube(error_df=error_df)
+    daily_errors = counts(cube, 'daily_errors', 'date')
 
     # Calculate anomaly threshold (2 standard deviations from mean)
-    mean_errors = daily_errors.mean()
-    std_errors = daily_errors.std()
-    threshold = mean_errors + (2 * std_errors)
+    threshold = anomaly_threshold(daily_errors)
 
     # Plot daily errors
     bars = plt.bar(daily_errors.index, daily_errors.values, alpha=0.7, color='lightblue')
@@ -143,23 +176,20 @@ def error_transactions_over_period(error_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/error_transactions_over_period.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
-                          output_dir + "/error_transactions_over_period.png", "B2")
+                          output_dir + "/error_transactions_over_period.png", "B2", report=report)
 
 
-def error_transactions_by_action(error_df, parsed_df, output_dir, output_file_name, top_n=10):
+def error_transactions_by_action(error_df, parsed_df, output_dir, output_file_name, top_n=10, report=None,
+                                 cube=None):
     """Top Error Transactions by Action"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
-    # Merge error data with parsed transactions to get action information
-    error_with_action = error_df.merge(
-        parsed_df[['request_id', 'action']],
-        on='request_id',
-        how='left'
-    )
-
-    # Count errors by action
-    error_by_action = error_with_action['action'].value_counts()
+    # Count errors by action, using the error to transaction merge done when the cube was built
+    cube = cube if cube is not None else build_aggregate_cube(parsed_df=parsed_df, error_df=error_df)
+    error_by_action = counts(cube, 'error_actions', 'action')
 
     # Get the top N actions (default is 10)
     top_error_by_action = error_by_action.head(top_n)
@@ -171,16 +201,19 @@ def error_transactions_by_action(error_df, parsed_df, output_dir, output_file_na
     plt.xticks(rotation=45, ha='right')  # Rotate x-axis labels for better readability
     plt.tight_layout()
     plt.savefig(output_dir + f'/top_{top_n}_error_transactions_by_action.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
-                          output_dir + f"/top_{top_n}_error_transactions_by_action.png", "B60")
+                          output_dir + f"/top_{top_n}_error_transactions_by_action.png", "B60", report=report)
 
 
-def top_users_error_transactions(error_df, output_dir, output_file_name):
+def top_users_error_transactions(error_df, output_dir, output_file_name, report=None, cube=None):
     """Top users with error transactions"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Get top 20 users by error count
-    top_error_users = error_df['userId'].value_counts().head(20)
+    cube = cube if cube is not None else build_aggregate_cube(error_df=error_df)
+    top_error_users = counts(cube, 'user_errors', 'userId').head(20)
 
     plt.barh(range(len(top_error_users)), top_error_users.values, alpha=0.7, color='lightcoral')
     plt.yticks(range(len(top_error_users)), top_error_users.index)
@@ -190,17 +223,49 @@ def top_users_error_transactions(error_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/top_users_error_transactions.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
-                          output_dir + "/top_users_error_transactions.png", "B118")
+                          output_dir + "/top_users_error_transactions.png", "B118", report=report)
+
 
+def error_rate_anomalies(error_df, output_dir, output_file_name, report=None, cube=None):
+    """Errors per hour (or minute) against their EWMA baseline, with anomalies marked"""
+    plt = _pyplot()
+    plt.figure(figsize=(7, 4))
 
-def total_debit_credit_loss(user_analysis_df, output_dir, output_file_name):
+    # Buckets were scored by the ErrorRateMonitor when the cube was built
+    cube = cube if cube is not None else build_aggregate_cube(error_df=error_df)
+    error_rate = cube['error_rate']
+    anomalies = error_rate[error_rate['anomaly']]
+
+    plt.plot(error_rate['bucket'], error_rate['error_count'], color='lightcoral', linewidth=1, label='Errors')
+    plt.plot(error_rate['bucket'], error_rate['baseline'], color='gray', linestyle='--', linewidth=1,
+             label='EWMA baseline')
+    plt.plot(error_rate['bucket'], error_rate['upper_bound'], color='red', linestyle=':', alpha=0.5,
+             label='Anomaly threshold')
+    plt.scatter(anomalies['bucket'], anomalies['error_count'], color='red', zorder=3, label='Anomaly')
+    plt.title('Error Rate Anomalies', fontsize=16, fontweight='bold')
+    plt.xlabel('Time', fontsize=12)
+    plt.ylabel('Number of Error Transactions', fontsize=12)
+    plt.xticks(rotation=45)
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(output_dir + '/error_rate_anomalies.png', dpi=300, bbox_inches='tight')
+    plt.close()
+    insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
+                          output_dir + "/error_rate_anomalies.png", "B292", report=report)
+
+
+def total_debit_credit_loss(user_analysis_df, output_dir, output_file_name, report=None, cube=None):
     """Total overall debit and credit loss"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
     # Calculate totals
-    total_debit_loss = user_analysis_df['Total_debit_loss'].sum()
-    total_credit_loss = user_analysis_df['Total_credit_loss'].sum()
+    cube = cube if cube is not None else build_aggregate_cube(user_analysis_df=user_analysis_df)
+    total_debit_loss = cube['losses']['Total_debit_loss'].iloc[0]
+    total_credit_loss = cube['losses']['Total_credit_loss'].iloc[0]
 
     # Create bar chart
     categories = ['Total Debit Loss', 'Total Credit Loss']
@@ -219,17 +284,19 @@ def total_debit_credit_loss(user_analysis_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/total_debit_credit_loss.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
-                          output_dir + "/total_debit_credit_loss.png", "B176")
+                          output_dir + "/total_debit_credit_loss.png", "B176", report=report)
 
 
-def first_error_reason_count(user_analysis_df, output_dir, output_file_name):
+def first_error_reason_count(user_analysis_df, output_dir, output_file_name, report=None, cube=None):
     """First error transaction reason count (ignore nan - nan)"""
+    plt = _pyplot()
     plt.figure(figsize=(7, 4))
 
-    # Filter out 'nan - nan' and count reasons
-    reasons = user_analysis_df[user_analysis_df['First_error_transaction_reason'] != 'nan - nan']
-    reason_counts = reasons['First_error_transaction_reason'].value_counts()
+    # Count reasons, with 'nan - nan' filtered out when the cube was built
+    cube = cube if cube is not None else build_aggregate_cube(user_analysis_df=user_analysis_df)
+    reason_counts = counts(cube, 'first_error_reasons', 'First_error_transaction_reason')
 
     # Create horizontal bar chart for better readability
     plt.barh(range(len(reason_counts)), reason_counts.values, alpha=0.7, color='skyblue')
@@ -240,28 +307,146 @@ def first_error_reason_count(user_analysis_df, output_dir, output_file_name):
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     plt.savefig(output_dir + '/first_error_reason_count.png', dpi=300, bbox_inches='tight')
+    plt.close()
     insert_chart_to_excel(output_dir, output_file_name, "Error Analysis",
-                          output_dir + "/total_debit_credit_loss.png", "B234")
-
+                          output_dir + "/total_debit_credit_loss.png", "B234", report=report)
+
+
+# Each chart with the frames it is drawn from and the cube table it needs
+CHART_SECTIONS = [
+    ("Transaction Analysis", [
+        (transaction_count_over_period, ['parsed_df'], 'daily_transactions'),
+        (credit_transactions_over_period, ['parsed_df'], 'daily_transactions'),
+        (debit_transactions_over_period, ['parsed_df'], 'daily_transactions'),
+        (transactions_by_action_over_period, ['parsed_df'], 'action_transactions'),
+        (top_users_transacting, ['parsed_df'], 'user_transactions'),
+    ]),
+    ("Error Analysis", [
+        (error_transactions_over_period, ['error_df'], 'daily_errors'),
+        (error_transactions_by_action, ['error_df', 'parsed_df'], 'error_actions'),
+        (top_users_error_transactions, ['error_df'], 'user_errors'),
+        (error_rate_anomalies, ['error_df'], 'error_rate'),
+    ]),
+    ("Loss Analysis", [
+        (total_debit_credit_loss, ['user_analysis_df'], 'losses'),
+        (first_error_reason_count, ['user_analysis_df'], 'first_error_reasons'),
+    ]),
+]
+
+
+def chart_sections(cube):
+    """CHART_SECTIONS without the charts whose table is missing from the cube (e.g. a streaming summary)"""
+    sections = []
+    for section, charts in CHART_SECTIONS:
+        available = [(chart, frames) for chart, frames, table in charts if table in cube]
+        if available:
+            sections.append((section, available))
+    return sections
+
+
+class ChartRecorder:
+    """Stand-in report that records chart placements so a worker process can hand them back"""
+
+    def __init__(self):
+        self.images = []
+
+    def add_image(self, sheet_name, image_path, cell):
+        self.images.append((sheet_name, image_path, cell))
+
+
+def _render_chart(chart, frame_count, output_dir, output_file_name, cube):
+    plt = _pyplot()
+    plt.switch_backend('Agg')
+    recorder = ChartRecorder()
+    chart(*([None] * frame_count), output_dir, output_file_name, report=recorder, cube=cube)
+    return recorder.images
+
+
+def render_charts_parallel(cube, output_dir, output_file_name, report=None, workers=None):
+    """Render every chart from the cube in worker processes, then place them in chart order"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_render_chart, chart, len(frames), output_dir, output_file_name, cube)
+            for _, charts in chart_sections(cube) for chart, frames in charts
+        ]
+        for future in futures:
+            for sheet_name, image_path, cell in future.result():
+                insert_chart_to_excel(output_dir, output_file_name, sheet_name, image_path, cell, report=report)
+
+
+def add_native_charts(report, cube, top_n=10):
+    """Add every chart to the report as a native Excel bar chart built from the cube"""
+    daily_errors = counts(cube, 'daily_errors', 'date')
+    anomaly_days = [i for i, value in enumerate(daily_errors.values) if value > anomaly_threshold(daily_errors)]
+    losses = cube['losses'].iloc[0]
+
+    report.add_bar_chart("Transaction Analysis", "B2", 'Transaction Count Over Time',
+                         daily_transaction_counts(cube), 'Date', 'Number of Transactions')
+    report.add_bar_chart("Transaction Analysis", "B60", 'Credit Transactions Over Time',
+                         daily_transaction_counts(cube, 'CREDIT'), 'Date', 'Number of Credit Transactions')
+    report.add_bar_chart("Transaction Analysis", "B118", 'Debit Transactions Over Time',
+                         daily_transaction_counts(cube, 'DEBIT'), 'Date', 'Number of Debit Transactions')
+    report.add_bar_chart("Transaction Analysis", "B176", 'Transaction Count by Action',
+                         counts(cube, 'action_transactions', 'action').head(15), 'Action', 'Number of Transactions',
+                         horizontal=True)
+    report.add_bar_chart("Transaction Analysis", "B234", 'Top 10 Users by Transaction Count',
+                         counts(cube, 'user_transactions', 'userId').head(10), 'Users', 'Number of Transactions')
+
+    report.add_bar_chart("Error Analysis", "B2", 'Error Transactions Over Time (Anomalies Highlighted)',
+                         daily_errors, 'Date', 'Number of Error Transactions', highlight=anomaly_days)
+    report.add_bar_chart("Error Analysis", "B60", f'Top {top_n} Error Transactions by Action',
+                         counts(cube, 'error_actions', 'action').head(top_n), 'Action', 'Number of Errors')
+    report.add_bar_chart("Error Analysis", "B118", 'Top 20 Users by Error Transaction Count',
+                         counts(cube, 'user_errors', 'userId').head(20), 'Users', 'Number of Error Transactions',
+                         horizontal=True)
+    report.add_bar_chart("Error Analysis", "B176", 'Total Debit vs Credit Loss',
+                         pd.Series([losses['Total_debit_loss'], losses['Total_credit_loss']],
+                                   index=['Total Debit Loss', 'Total Credit Loss']), None, 'Loss Amount')
+    report.add_bar_chart("Error Analysis", "B234", 'First Error Transaction Reasons',
+                         counts(cube, 'first_error_reasons', 'First_error_transaction_reason'), 'Error Reason', 'Count',
+                         horizontal=True)
+    if 'error_rate' in cube:
+        error_rate = cube['error_rate']
+        report.add_bar_chart("Error Analysis", "B292", 'Error Rate Anomalies',
+                             pd.Series(error_rate['error_count'].to_numpy(), index=error_rate['bucket'].astype(str)),
+                             'Time', 'Number of Error Transactions',
+                             highlight=list(error_rate.index[error_rate['anomaly']]))
+
+
+def run_complete_analysis(parsed_df, error_df, user_analysis_df, output_dir, output_file_name, report=None,
+                          cube=None, chart_workers=1, chart_format='png', request_index=None,
+                          anomaly_frequency=DEFAULT_FREQUENCY):
+    """Run all analysis functions.
+
+    The frames are aggregated once into a cube that is saved to output_dir/aggregate_cube. Passing a
+    loaded cube instead regenerates the charts without the raw frames. With chart_workers > 1 the PNG
+    charts are rendered in worker processes; chart_format='native' skips matplotlib and adds native
+    Excel charts to the report builder instead. Buckets of the error rate table that were flagged as
+    anomalies and the balance chain breaks are also added to the report as sheets.
+    """
+    if cube is None:
+        cube = build_aggregate_cube(parsed_df, error_df, user_analysis_df, request_index, anomaly_frequency)
+        save_aggregate_cube(cube, os.path.join(output_dir, CUBE_DIR))
 
-def run_complete_analysis(parsed_df, error_df, user_analysis_df, output_dir, output_file_name):
-    """Run all analysis functions"""
     print("=== Starting Complete Dataset Analysis ===\n")
-    print("\n=== Transaction Analysis ===")
-    transaction_count_over_period(parsed_df, output_dir, output_file_name)
-    credit_transactions_over_period(parsed_df, output_dir, output_file_name)
-    debit_transactions_over_period(parsed_df, output_dir, output_file_name)
-    transactions_by_action_over_period(parsed_df, output_dir, output_file_name)
-    top_users_transacting(parsed_df, output_dir, output_file_name)
-
-    print("\n=== Error Analysis ===")
-    error_transactions_over_period(error_df, output_dir, output_file_name)
-    error_transactions_by_action(error_df, parsed_df, output_dir, output_file_name)
-    top_users_error_transactions(error_df, output_dir, output_file_name)
-
-    print("\n=== Loss Analysis ===")
-    total_debit_credit_loss(user_analysis_df, output_dir, output_file_name)
-    first_error_reason_count(user_analysis_df, output_dir, output_file_name)
+    if chart_format == 'native':
+        if report is None:
+            raise ValueError("Native charts need an ExcelReportBuilder report")
+        add_native_charts(report, cube)
+    elif chart_workers > 1:
+        render_charts_parallel(cube, output_dir, output_file_name, report=report, workers=chart_workers)
+    else:
+        frames = {'parsed_df': parsed_df, 'error_df': error_df, 'user_analysis_df': user_analysis_df}
+        for section, charts in chart_sections(cube):
+            print(f"\n=== {section} ===")
+            for chart, frame_names in charts:
+                chart(*[frames[name] for name in frame_names], output_dir, output_file_name, report=report, cube=cube)
+
+    if report is not None and 'error_rate' in cube:
+        error_rate = cube['error_rate']
+        report.add_frame(error_rate[error_rate['anomaly']], ANOMALY_SHEET)
+    if report is not None and 'balance_breaks' in cube:
+        report.add_frame(cube['balance_breaks'], BALANCE_BREAKS_SHEET)
 
     print("\n=== Analysis Complete ===")
     print("All charts have been saved to output_reports/ directory")
@@ -0,0 +1,120 @@
+import math
+
+import pandas as pd
+
+# Bucket sizes the error rate can be monitored at, as pandas frequency aliases
+FREQUENCIES = {'minute': 'min', 'hour': 'h'}
+DEFAULT_FREQUENCY = 'hour'
+ANOMALY_COLUMNS = ['bucket', 'error_count', 'baseline', 'upper_bound', 'z_score', 'anomaly']
+
+# Explicit, so a table without any scored bucket still has a boolean anomaly mask
+ANOMALY_DTYPES = {
+    'bucket': 'datetime64[ns, UTC]',
+    'error_count': 'int64',
+    'baseline': 'float64',
+    'upper_bound': 'float64',
+    'z_score': 'float64',
+    'anomaly': 'bool',
+}
+
+
+class ErrorRateMonitor:
+    """Flags spikes in per-minute or per-hour error counts against an EWMA baseline.
+
+    Error timestamps are counted into buckets as chunks arrive. A bucket is scored once `lateness`
+    newer buckets have been seen (or on flush), against the exponentially weighted mean and standard
+    deviation of the buckets before it, so the state is a few numbers however long the stream runs.
+    After `warmup` buckets, a bucket is an anomaly when its count exceeds mean + threshold * std.
+    Buckets without errors count as zero. Errors for a bucket that was already scored are only
+    counted in late_errors.
+    """
+
+    def __init__(self, frequency=DEFAULT_FREQUENCY, alpha=0.1, threshold=3.0, warmup=24, lateness=2,
+                 max_history=10_000):
+        self.frequency = frequency
+        self.step = pd.tseries.frequencies.to_offset(FREQUENCIES[frequency])
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.lateness = lateness
+        self.max_history = max_history
+        self.mean = 0.0
+        self.variance = 0.0
+        self.scored = 0
+        self.last_bucket = None
+        self.late_errors = 0
+        self.pending = pd.Series(dtype='int64')
+        self.history = []
+
+    def update(self, timestamps):
+        """Count a chunk of error timestamps and score every bucket that can no longer change"""
+        timestamps = pd.Series(timestamps)
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps)
+        timestamps = timestamps.dropna()
+        self.add_counts(timestamps.dt.floor(FREQUENCIES[self.frequency]).value_counts())
+
+    def add_counts(self, bucket_counts):
+        """Like update, for error counts already grouped by bucket start"""
+        if self.last_bucket is not None:
+            late = bucket_counts.index <= self.last_bucket
+            self.late_errors += int(bucket_counts[late].sum())
+            bucket_counts = bucket_counts[~late]
+        if bucket_counts.empty:
+            return
+        self.pending = bucket_counts if self.pending.empty else self.pending.add(bucket_counts, fill_value=0)
+        self._score_until(self.pending.index.max() - self.lateness * self.step)
+
+    def flush(self):
+        """Score all pending buckets, e.g. at the end of a batch"""
+        if not self.pending.empty:
+            self._score_until(self.pending.index.max())
+
+    def _score_until(self, end):
+        start = self.pending.index.min() if self.last_bucket is None else self.last_bucket + self.step
+        if start > end:
+            return
+        buckets = pd.date_range(start, end, freq=self.step)
+        for bucket, count in self.pending.reindex(buckets, fill_value=0).items():
+            self._score(bucket, int(count))
+        self.pending = self.pending[self.pending.index > end]
+        self.last_bucket = end
+
+    def _score(self, bucket, count):
+        if self.scored == 0:
+            self.mean = float(count)
+        baseline = self.mean
+        std = max(math.sqrt(self.variance), 1.0)
+        upper_bound = baseline + self.threshold * std if self.scored >= self.warmup else math.nan
+        self.history.append({
+            'bucket': bucket,
+            'error_count': count,
+            'baseline': baseline,
+            'upper_bound': upper_bound,
+            'z_score': (count - baseline) / std,
+            'anomaly': count > upper_bound,
+        })
+        if self.max_history and len(self.history) > self.max_history:
+            del self.history[:len(self.history) - self.max_history]
+
+        difference = count - self.mean
+        increment = self.alpha * difference
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + difference * increment)
+        self.scored += 1
+
+    def table(self):
+        """Every scored bucket (up to max_history) with its baseline and anomaly flag"""
+        return pd.DataFrame(self.history, columns=ANOMALY_COLUMNS).astype(ANOMALY_DTYPES)
+
+    def anomalies(self):
+        table = self.table()
+        return table[table['anomaly']].reset_index(drop=True)
+
+
+def detect_error_anomalies(timestamps, frequency=DEFAULT_FREQUENCY, **options):
+    """Score a complete set of error timestamps in one batch and return the bucket table"""
+    monitor = ErrorRateMonitor(frequency, max_history=None, **options)
+    monitor.update(timestamps)
+    monitor.flush()
+    return monitor.table()
@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import glob
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_logs import generate_logs
+from instrumentation import peak_rss_mb
+
+STAGES = [
+    'parse_logs',
+    'generate_transaction_data',
+    'generate_error_data',
+    'analyze_all_users',
+    'analyze_all_users_vectorized',
+    'generate_excel',
+]
+
+DEFAULT_SCALES = [1_000, 10_000, 100_000]
+
+# The per-user loop scans every row for every user, so it is skipped above this many transactions
+MAX_LOOP_SCALE = 20_000
+
+
+def _read_logs(log_dir):
+    texts = []
+    for file_path in sorted(glob.glob(os.path.join(log_dir, '*.gz'))):
+        with gzip.open(file_path, 'rt') as f:
+            texts.append(f.read())
+    return texts
+
+
+def _measure_stage(stage, log_dir, output_dir, results):
+    """Run one stage in this (fresh) process; inputs are prepared from earlier stages untimed"""
+    from ingest import generate_error_data, generate_transaction_data
+    from parser import parse_logs
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        log_texts = _read_logs(log_dir)
+        if stage == 'parse_logs':
+            run = lambda: pd.concat([parse_logs(text) for text in log_texts], ignore_index=True)
+            rows = None
+        else:
+            all_data = pd.concat([parse_logs(text) for text in log_texts], ignore_index=True)
+            del log_texts
+            error_logs = all_data[all_data['log_level'] == 'ERROR']
+            if stage == 'generate_transaction_data':
+                run, rows = (lambda: generate_transaction_data(all_data)), len(all_data)
+            elif stage == 'generate_error_data':
+                run, rows = (lambda: generate_error_data(error_logs)), len(error_logs)
+            else:
+                parsed_df = generate_transaction_data(all_data)
+                error_df = generate_error_data(error_logs)
+                del all_data, error_logs
+                if stage == 'analyze_all_users':
+                    from user_analysis import analyze_all_users
+                    run, rows = (lambda: analyze_all_users(error_df, parsed_df)), len(error_df)
+                elif stage == 'analyze_all_users_vectorized':
+                    from user_analysis import analyze_all_users_vectorized
+                    run, rows = (lambda: analyze_all_users_vectorized(error_df, parsed_df)), len(error_df)
+                else:
+                    from reports.excel_report import generate_excel
+                    from user_analysis import analyze_all_users_vectorized
+                    analysis_df = analyze_all_users_vectorized(error_df, parsed_df)
+                    run = lambda: generate_excel(parsed_df, error_df, analysis_df, 'benchmark.xlsx', output_dir)
+                    rows = len(parsed_df) + len(error_df) + len(analysis_df)
+
+        rss_before = peak_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        output = run()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    if rows is None:
+        rows = len(output)
+    results.put({
+        'stage': stage,
+        'rows': rows,
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'rows_per_second': round(rows / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_before_stage_mb': rss_before,
+    })
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, stages=STAGES, error_rate=0.05, days=7, seed=0):
+    """Run every stage at every scale, each in a fresh process so peak RSS is per stage"""
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            log_dir = os.path.join(work_dir, 'logs')
+            generate_logs(log_dir, users=max(1, scale // 10), transactions=scale, error_rate=error_rate,
+                          days=days, seed=seed)
+            for stage in stages:
+                if stage == 'analyze_all_users' and scale > MAX_LOOP_SCALE:
+                    continue
+                queue = context.Queue()
+                process = context.Process(target=_measure_stage, args=(stage, log_dir, work_dir, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                result['scale'] = scale
+                results.append(result)
+                print(f"{stage:<32} {scale:>9} transactions  {result['wall_seconds']:>9.3f}s  "
+                      f"{result['rows_per_second'] or 0:>12,.0f} rows/s  {result['peak_rss_mb']:>8.1f} MB")
+
+    return results
+
+
+def compare(results, baseline):
+    """Print the speedup of each stage and scale against a previous baseline file"""
+    previous = {(r['stage'], r['scale']): r for r in baseline['results']}
+    for result in results:
+        before = previous.get((result['stage'], result['scale']))
+        if before and result['wall_seconds']:
+            print(f"{result['stage']:<32} {result['scale']:>9}  "
+                  f"{before['wall_seconds'] / result['wall_seconds']:>6.2f}x vs baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on synthetic logs.")
+    parser.add_argument("--scales", type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="Numbers of transactions to benchmark")
+    parser.add_argument("--stages", nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), 'baseline.json'),
+                        help="JSON file to write the results to")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.stages, args.error_rate, args.days, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,91 @@
+import argparse
+import gzip
+import os
+import random
+from datetime import datetime, timedelta
+
+ACTIONS = ['renewal', 'refund', 'topup', 'manual', 'delivery', 'cancellation']
+SOURCES = ['subscription', 'payment', 'admin']
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def _transaction_entry(rng, ts, request_id, index, user_id):
+    transaction_type = rng.choice(['DEBIT', 'CREDIT'])
+    old_balance = rng.randint(500, 50_000)
+    amount = rng.randint(1, 500)
+    new_balance = old_balance - amount if transaction_type == 'DEBIT' else old_balance + amount
+    return (
+        f"{ts} {ts}\t{request_id}\tINFO\tTransaction {{\n"
+        f"  id: 'txn-{index:09d}',\n"
+        f"  type: '{transaction_type}',\n"
+        f"  source: '{rng.choice(SOURCES)}',\n"
+        f"  action: '{rng.choice(ACTIONS)}',\n"
+        f"  userId: '{user_id}',\n"
+        f"  paymentBalance: {old_balance},\n"
+        f"  updatePaymentBalance: {rng.choice(['true', 'false'])},\n"
+        f"  metadata: '{{}}',\n"
+        f"  currency: 'AED',\n"
+        f"  amount: {amount},\n"
+        f"  vat: {amount // 20},\n"
+        f"  oldBalance: {old_balance},\n"
+        f"  newBalance: {new_balance}\n"
+        f"}}\n"
+    )
+
+
+def _error_entry(rng, ts, request_id, user_id):
+    return (f"{ts} {ts}\t{request_id}\tERROR\tBalance out of sync {{ userId: '{user_id}', "
+            f"subscriptionBalance: {rng.randint(0, 50_000)}, paymentBalance: {rng.randint(0, 50_000)} }}\n")
+
+
+def generate_logs(output_dir, users=1_000, transactions=10_000, error_rate=0.05, days=7, files=4,
+                  start=datetime(2024, 1, 1), seed=0):
+    """Write gzipped Lambda-style logs in the format parse_logs and TRANSACTION_PATTERN expect.
+
+    Every invocation gets START/END/REPORT lines and an INFO line; transactions are spread evenly
+    over the files and days, and error_rate of them log a balance sync ERROR for the same request.
+    The output only depends on the arguments. Returns the paths of the written files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    span_ms = days * 24 * 3600 * 1000
+    per_file = -(-transactions // files)
+    paths = []
+
+    for file_index in range(files):
+        path = os.path.join(output_dir, f"synthetic-{file_index:04d}.gz")
+        first = file_index * per_file
+        with gzip.open(path, 'wt') as f:
+            for index in range(first, min(first + per_file, transactions)):
+                moment = start + timedelta(milliseconds=span_ms * index // transactions + rng.randint(0, 999))
+                ts = _timestamp(moment)
+                request_id = f"{rng.getrandbits(32):08x}-{rng.getrandbits(16):04x}-{rng.getrandbits(16):04x}"
+                user_id = f"user-{rng.randrange(users):06d}"
+
+                f.write(f"{ts} START RequestId: {request_id} Version: $LATEST\n")
+                f.write(f"{ts} {ts}\t{request_id}\tINFO\tSyncing balance for user {user_id}\n")
+                f.write(_transaction_entry(rng, ts, request_id, index, user_id))
+                if rng.random() < error_rate:
+                    f.write(_error_entry(rng, _timestamp(moment + timedelta(milliseconds=50)), request_id, user_id))
+                f.write(f"{ts} END RequestId: {request_id}\n")
+                f.write(f"{ts} REPORT RequestId: {request_id}\tDuration: {rng.randint(5, 900)}.00 ms\n")
+        paths.append(path)
+
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic balance sync logs.")
+    parser.add_argument("output_dir", help="Directory to write .gz log files to")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--transactions", type=int, default=10_000)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_logs(args.output_dir, users=args.users, transactions=args.transactions, error_rate=args.error_rate,
+                  days=args.days, files=args.files, seed=args.seed)
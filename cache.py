@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from schema import ERROR_DTYPES, TRANSACTION_DTYPES, apply_schema
+
+MANIFEST_FILE = 'manifest.json'
+
+# Changes whenever the schema does, so rows cached under an older schema are parsed again
+SCHEMA_VERSION = hashlib.sha256(json.dumps([TRANSACTION_DTYPES, ERROR_DTYPES]).encode()).hexdigest()[:16]
+
+
+def file_digest(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """Per-file cache of parsed transaction and error rows, stored as Parquet.
+
+    The manifest maps each input path to its size, mtime and sha256. A file whose size and mtime
+    are unchanged is reused without hashing; otherwise it is hashed and only re-parsed when its
+    content changed. Entries cached under another SCHEMA_VERSION are never reused.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _data_paths(self, digest):
+        return (os.path.join(self.cache_dir, f"{digest}_transactions.parquet"),
+                os.path.join(self.cache_dir, f"{digest}_errors.parquet"))
+
+    def lookup(self, file_path):
+        """Return the cached (parsed_df, error_df) for file_path, or None if it must be parsed"""
+        entry = self.manifest.get(os.path.abspath(file_path))
+        if entry is None or entry.get('schema') != SCHEMA_VERSION:
+            return None
+
+        stat = os.stat(file_path)
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            # Rows are stored by content hash, so a touched or copied file can still be a hit
+            entry.update(size=stat.st_size, mtime=stat.st_mtime, sha256=file_digest(file_path))
+
+        transactions_path, errors_path = self._data_paths(entry['sha256'])
+        if not (os.path.exists(transactions_path) and os.path.exists(errors_path)):
+            return None
+        return (apply_schema(pd.read_parquet(transactions_path), TRANSACTION_DTYPES),
+                apply_schema(pd.read_parquet(errors_path), ERROR_DTYPES))
+
+    def store(self, file_path, parsed_df, error_df):
+        stat = os.stat(file_path)
+        digest = file_digest(file_path)
+        transactions_path, errors_path = self._data_paths(digest)
+        parsed_df.to_parquet(transactions_path, index=False)
+        error_df.to_parquet(errors_path, index=False)
+        self.manifest[os.path.abspath(file_path)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': digest,
+            'schema': SCHEMA_VERSION,
+        }
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from sketches import BloomFilter
+
+DEDUP_MODES = ['exact', 'bloom']
+DEFAULT_BLOOM_CAPACITY = 10_000_000
+DEFAULT_BLOOM_ERROR_RATE = 0.001
+
+
+def entry_fingerprints(df):
+    """64-bit fingerprint of each parsed entry: its request_id, timestamp and every field of its message"""
+    return hash_pandas_object(df, index=False).to_numpy()
+
+
+class FingerprintSet:
+    """Exact set of fingerprints, kept as one sorted uint64 array (8 bytes per entry)"""
+
+    def __init__(self):
+        self.values = np.empty(0, dtype=np.uint64)
+
+    def contains(self, fingerprints):
+        index = np.minimum(np.searchsorted(self.values, fingerprints), max(len(self.values) - 1, 0))
+        return self.values[index] == fingerprints if len(self.values) else np.zeros(len(fingerprints), dtype=bool)
+
+    def add(self, fingerprints):
+        self.values = np.union1d(self.values, fingerprints)
+
+
+class Deduplicator:
+    """Drops parsed entries already seen in an earlier batch or earlier in the same batch.
+
+    Batches are passed in log order, so the first copy of an entry is the one kept. The 'exact'
+    mode grows by 8 bytes per distinct entry; the 'bloom' mode stays at the size of its filter, at
+    the cost of dropping about error_rate of the distinct entries as false duplicates once capacity
+    entries have been seen.
+    """
+
+    def __init__(self, mode='exact', capacity=DEFAULT_BLOOM_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode: {mode}")
+        self.seen = FingerprintSet() if mode == 'exact' else BloomFilter(capacity, error_rate)
+        self.duplicates = 0
+
+    def drop_duplicates(self, df):
+        if df.empty:
+            return df
+        fingerprints = entry_fingerprints(df)
+        repeated = pd.Series(fingerprints).duplicated().to_numpy(copy=True)
+        first_copies = fingerprints[~repeated]
+        repeated[~repeated] = self.seen.contains(first_copies)
+        self.seen.add(fingerprints[~repeated])
+        removed = int(repeated.sum())
+        self.duplicates += removed
+        return df[~repeated].reset_index(drop=True) if removed else df
@@ -0,0 +1,101 @@
+import gzip
+import os
+
+import pandas as pd
+
+from parser import (PIPELINE_COLUMNS, PIPELINE_KINDS, TRANSACTION_PATTERN, extract_transactions,
+                    parse_balance_sync_message, parse_log_stream, parse_logs)
+from schema import ERROR_DTYPES, TRANSACTION_DTYPES, apply_schema, concat_categoricals
+
+
+def generate_transaction_data(df):
+    transactions = extract_transactions(df['message']) if not df.empty else pd.DataFrame()
+    if transactions.empty:
+        return apply_schema(pd.DataFrame(columns=list(TRANSACTION_PATTERN) + ['request_id', 'timestamp']),
+                            TRANSACTION_DTYPES)
+
+    transactions['request_id'] = df.loc[transactions.index, 'dup_request_id'].tolist()
+    transactions['timestamp'] = df.loc[transactions.index, 'timestamp'].tolist()
+    parsed_df = transactions.reset_index(drop=True)
+    return apply_schema(parsed_df, TRANSACTION_DTYPES)
+
+
+def generate_error_data(df):
+    records = []
+    for ind, row in df.iterrows():
+        parsed_message = parse_balance_sync_message(row['message'])
+        if parsed_message != dict():
+            parsed_message['request_id'] = row['dup_request_id']
+            parsed_message['timestamp'] = row['timestamp']
+            records.append(parsed_message)
+    if not records:
+        return apply_schema(
+            pd.DataFrame(columns=['userId', 'subscriptionBalance', 'paymentBalance', 'request_id', 'timestamp']),
+            ERROR_DTYPES)
+    return apply_schema(pd.DataFrame(records), ERROR_DTYPES)
+
+
+def find_log_files(input_dir):
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        for file_name in file_names:
+            if file_name.endswith('.gz'):
+                yield os.path.join(dir_path, file_name)
+
+
+def combine_frames(frames):
+    """Concatenate per-chunk frames, re-inferring dtypes that a single frame would have had"""
+    non_empty = [df for df in frames if not df.empty]
+    if not non_empty:
+        return frames[0] if frames else pd.DataFrame()
+    return concat_categoricals(non_empty, pd.concat(non_empty, ignore_index=True).infer_objects())
+
+
+def combine_parsed(parsed):
+    """Concatenate (transactions, errors) frame pairs; without any, the empty frames of the parsed schema"""
+    if not parsed:
+        return generate_transaction_data(pd.DataFrame()), generate_error_data(pd.DataFrame())
+    return combine_frames([frames[0] for frames in parsed]), combine_frames([frames[1] for frames in parsed])
+
+
+def parse_log_file(file_path, chunk_size=None, stats=None, time_range=None):
+    """Parse one .gz file into its transaction and error frames.
+
+    If a stats dict is given, the number of parsed log entries and decompressed bytes are added to it.
+    With a (since, until) time_range, entries outside it are skipped before they are parsed.
+    """
+    return combine_parsed(list(iter_parsed_chunks(file_path, chunk_size, stats, time_range)))
+
+
+def iter_parsed_chunks(file_path, chunk_size=None, stats=None, time_range=None):
+    """Yield (transactions, errors) frames for each chunk of one .gz file.
+
+    Only entries that can be transactions or errors are parsed, and only into the columns those two
+    frames are built from, so chunk_size counts these entries.
+    """
+    entry_count = 0
+
+    with gzip.open(file_path, 'rt') as f:
+        if chunk_size:
+            chunks = parse_log_stream(f, chunk_size, PIPELINE_KINDS, PIPELINE_COLUMNS, time_range)
+        else:
+            chunks = [parse_logs(f.read(), PIPELINE_KINDS, PIPELINE_COLUMNS, time_range)]
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            entry_count += len(chunk)
+            yield parse_chunk(chunk)
+        bytes_decompressed = f.buffer.tell()
+
+    if stats is not None:
+        count_stats(stats, log_entries=entry_count, bytes_decompressed=bytes_decompressed)
+
+
+def parse_chunk(chunk):
+    """The transaction and error frames of one frame of parsed log entries"""
+    return generate_transaction_data(chunk), generate_error_data(chunk[chunk['log_level'] == 'ERROR'])
+
+
+def count_stats(stats, **counts):
+    """Add counts to the totals in a stats dict"""
+    for key, value in counts.items():
+        stats[key] = stats.get(key, 0) + value
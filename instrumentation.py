@@ -0,0 +1,87 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory of this process, or of its waited-for children, in MB"""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class RunInstrumentation:
+    """Records wall time, CPU time, row counts and peak memory for each pipeline stage.
+
+    Stages are wrapped in ``with instrumentation.stage(name) as record:``; the caller adds counts
+    such as rows_in, rows_out, files_read and bytes_decompressed to the yielded record. With a
+    profile_dir every stage also runs under cProfile and is dumped there as <stage>.prof plus a
+    text listing of the top functions. Only this process is profiled; work done in worker processes
+    shows up as time spent waiting on them.
+    """
+
+    def __init__(self, command, profile_dir=None):
+        self.command = command
+        self.profile_dir = profile_dir
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.stages = []
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name):
+        record = {'stage': name}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        rss_before = peak_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(name, profiler)
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            children_cpu = ((children_after.ru_utime + children_after.ru_stime) -
+                            (children_before.ru_utime + children_before.ru_stime))
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 3)
+            record['cpu_seconds'] = round(time.process_time() - cpu_start + children_cpu, 3)
+            # ru_maxrss is a high-water mark of the whole process, so a stage only shows up in
+            # peak_rss_mb if it raised it; peak_rss_growth_mb is how much it did
+            record['rss_before_stage_mb'] = rss_before
+            record['peak_rss_mb'] = peak_rss_mb()
+            record['peak_rss_growth_mb'] = round(record['peak_rss_mb'] - rss_before, 1)
+            record['peak_child_rss_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+            self.stages.append(record)
+            print(f"[{name}] {record['wall_seconds']:.2f}s wall, {record['cpu_seconds']:.2f}s CPU, "
+                  f"process peak RSS so far {record['peak_rss_mb']} MB "
+                  f"(+{record['peak_rss_growth_mb']} MB in this stage)")
+
+    def _dump_profile(self, name, profiler):
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+        listing = io.StringIO()
+        pstats.Stats(profiler, stream=listing).sort_stats('cumulative').print_stats(30)
+        with open(os.path.join(self.profile_dir, f"{name}.txt"), 'w') as f:
+            f.write(listing.getvalue())
+
+    def summary(self):
+        return {
+            'command': self.command,
+            'started_at': self.started_at.isoformat(),
+            'total_wall_seconds': round(time.perf_counter() - self.start, 3),
+            'stages': self.stages,
+        }
+
+    def write_summary(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
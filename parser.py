@@ -28,38 +28,138 @@ TRANSACTION_PATTERN = {
     'newBalance': r"newBalance: (\d+)",
 }
 
+TRANSACTION_INT_FIELDS = ['paymentBalance', 'amount', 'vat', 'oldBalance', 'newBalance']
 
-def parse_logs(log_text):
+TRANSACTION_MARKER = "id: '"
+
+
+ENTRY_START_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T[0-9:.]+Z')
+
+LOG_FIELDS = ['timestamp', 'type', 'request_id', 'version', 'dup_timestamp', 'dup_request_id', 'log_level']
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Substrings an entry of each record kind must contain, checked before any regex runs. They may let
+# through entries that are not of the kind (those are dropped downstream), but never drop one that is.
+RECORD_KIND_MARKERS = {
+    'transaction': TRANSACTION_MARKER,
+    'error': '\tERROR',
+}
+
+# What generate_transaction_data and generate_error_data read from the parsed log entries
+PIPELINE_KINDS = ('transaction', 'error')
+PIPELINE_COLUMNS = ['timestamp', 'dup_request_id', 'log_level', 'message']
+
+
+def parse_entry(entry, columns=None):
+    lines = entry.splitlines()
+    first = lines[0]
+    m = LOG_PATTERN.match(first)
+    rec = {k: None for k in LOG_FIELDS}
+    if m:
+        rec.update({k: m.group(k) for k in rec.keys()})
+    if m:
+        inline = first[m.end():].strip()
+    else:
+        inline = first
+    message = inline
+    if len(lines) > 1:
+        message += '\n' + '\n'.join(lines[1:])
+    rec['message'] = message
+    rec['raw_entry'] = entry
+    if columns is not None:
+        rec = {k: rec[k] for k in columns}
+    return rec
+
+
+def entry_timestamp_key(entry):
+    """Leading timestamp of an entry as a sortable string, with the fraction of a second padded to nanoseconds"""
+    m = ENTRY_START_PATTERN.match(entry)
+    if not m:
+        return None
+    seconds, _, fraction = m.group(0)[:-1].partition('.')
+    return f"{seconds}.{fraction[:9]:0<9}"
+
+
+def timestamp_key(timestamp):
+    """The entry_timestamp_key of a UTC pandas Timestamp"""
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S') + f".{timestamp.microsecond:06d}{timestamp.nanosecond:03d}"
+
+
+def entry_filter(kinds=None, time_range=None):
+    """Cheap test for entries that can be of one of the record kinds; None keeps everything.
+
+    With a (since, until) time_range of UTC Timestamps, either of them None, only entries whose
+    leading timestamp is at or after since and before until are kept.
+    """
+    if kinds is None:
+        keep = lambda entry: bool(entry.strip())
+    else:
+        markers = [RECORD_KIND_MARKERS[kind] for kind in kinds]
+        keep = lambda entry: any(marker in entry for marker in markers)
+    if time_range is None:
+        return keep
+
+    since, until = (None if bound is None else timestamp_key(bound) for bound in time_range)
+
+    def in_range(entry):
+        key = entry_timestamp_key(entry)
+        return key is not None and (since is None or key >= since) and (until is None or key < until)
+    return lambda entry: keep(entry) and in_range(entry)
+
+
+def parse_logs(log_text, kinds=None, columns=None, time_range=None):
+    """Parse log text into one row per entry.
+
+    With kinds (and time_range), entries that cannot be of those record kinds (or are outside the
+    range) are skipped before they are parsed, and with columns only those fields are kept (e.g.
+    without the duplicate raw_entry text).
+    """
     entries = re.split(r'(?=^\d{4}-\d{2}-\d{2}T[0-9:.]+Z)', log_text, flags=re.MULTILINE)
 
-    parsed_records = []
+    keep = entry_filter(kinds, time_range)
+    return parse_entries([entry for entry in entries if keep(entry)], columns)
 
-    for entry in entries:
-        if not entry.strip():
-            continue
-        lines = entry.splitlines()
-        first = lines[0]
-        m = LOG_PATTERN.match(first)
-        rec = {k: None for k in
-               ['timestamp', 'type', 'request_id', 'version', 'dup_timestamp', 'dup_request_id', 'log_level']}
-        if m:
-            rec.update({k: m.group(k) for k in rec.keys()})
-        if m:
-            inline = first[m.end():].strip()
-        else:
-            inline = first
-        message = inline
-        if len(lines) > 1:
-            message += '\n' + '\n'.join(lines[1:])
-        rec['message'] = message
-        rec['raw_entry'] = entry
-        parsed_records.append(rec)
+
+def parse_entries(entries, columns=None):
+    """Parse already separated log entries into a DataFrame with one row per entry"""
+    parsed_records = [parse_entry(entry, columns) for entry in entries]
 
     # Create DataFrame
-    df = pd.DataFrame(parsed_records)
+    df = pd.DataFrame(parsed_records, columns=columns)
     return df
 
 
+def iter_log_entries(lines):
+    """Reassemble multi-line log entries from an iterable of lines, splitting at timestamp boundaries"""
+    buffer = []
+    for line in lines:
+        if buffer and ENTRY_START_PATTERN.match(line):
+            yield ''.join(buffer)
+            buffer = []
+        buffer.append(line)
+    if buffer:
+        yield ''.join(buffer)
+
+
+def parse_log_stream(lines, chunk_size=DEFAULT_CHUNK_SIZE, kinds=None, columns=None, time_range=None):
+    """Parse an iterable of log lines into DataFrames of at most chunk_size entries.
+
+    kinds, columns and time_range select entries and fields like in parse_logs.
+    """
+    keep = entry_filter(kinds, time_range)
+    parsed_records = []
+    for entry in iter_log_entries(lines):
+        if not keep(entry):
+            continue
+        parsed_records.append(parse_entry(entry, columns))
+        if len(parsed_records) >= chunk_size:
+            yield pd.DataFrame(parsed_records, columns=columns)
+            parsed_records = []
+    if parsed_records:
+        yield pd.DataFrame(parsed_records, columns=columns)
+
+
 def parse_transaction(message):
     record = {}
     for key, pat in TRANSACTION_PATTERN.items():
@@ -70,7 +170,7 @@ def parse_transaction(message):
             record[key] = None
         else:
             val = m.group(1)
-            if key in ['paymentBalance', 'amount', 'vat', 'oldBalance', 'newBalance']:
+            if key in TRANSACTION_INT_FIELDS:
                 record[key] = int(val)
             elif key == 'updatePaymentBalance':
                 record[key] = True if val == 'true' else False
@@ -80,6 +180,39 @@ def parse_transaction(message):
     return record
 
 
+def _column_values(extracted, convert=None):
+    values = extracted.astype(object)
+    missing = extracted.isna()
+    if convert is not None:
+        values = values.map(convert, na_action='ignore').astype(object)
+    values[missing] = None
+    return values.tolist()
+
+
+def extract_transactions(messages):
+    """Column-wise equivalent of parse_transaction over a Series of messages.
+
+    Messages without the transaction marker are skipped before any regex runs. The result is
+    indexed like the matching messages and has the dtypes pd.DataFrame would infer from the
+    parse_transaction records.
+    """
+    candidates = messages[messages.str.contains(TRANSACTION_MARKER, regex=False, na=False)]
+    ids = candidates.str.extract(TRANSACTION_PATTERN['id'], expand=False)
+    candidates = candidates[ids.notna()]
+
+    columns = {}
+    for key, pat in TRANSACTION_PATTERN.items():
+        extracted = ids[ids.notna()] if key == 'id' else candidates.str.extract(pat, expand=False)
+        if key in TRANSACTION_INT_FIELDS:
+            columns[key] = _column_values(extracted, int)
+        elif key == 'updatePaymentBalance':
+            columns[key] = _column_values(extracted, lambda val: val == 'true')
+        else:
+            columns[key] = _column_values(extracted)
+
+    return pd.DataFrame(columns, index=candidates.index)
+
+
 def parse_balance_sync_message(message):
     uid = re.search(r"userId:\s*'([^']+)'", message)
     sub = re.search(r"subscriptionBalance:\s*([0-9]+(?:\.[0-9]+)?)", message)
@@ -0,0 +1,141 @@
+import gzip
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from ingest import combine_parsed, parse_chunk
+from parser import DEFAULT_CHUNK_SIZE, PIPELINE_COLUMNS, PIPELINE_KINDS, entry_filter, iter_log_entries, parse_entries
+
+DEFAULT_READERS = 2
+
+
+def _parse_entries(entries):
+    return parse_chunk(parse_entries(entries, PIPELINE_COLUMNS))
+
+
+class _FileResult:
+    def __init__(self):
+        self.futures = []
+        self.stats = None
+        self.error = None
+
+    def done(self):
+        finished = self.error is not None or self.stats is not None
+        return finished and all(future.done() for future in self.futures)
+
+    def result(self):
+        """(frames, error, stats) in the shape _parse_log_files yields"""
+        error = self.error
+        if error is None:
+            error = next((future.exception() for future in self.futures if future.exception()), None)
+        if error is not None:
+            return None, error, self.stats or {}
+        frames = [future.result() for future in self.futures]
+        return combine_parsed(frames), None, self.stats
+
+
+class _Reader(threading.Thread):
+    """Decompresses files taken from file_queue and puts chunks of candidate entries on work_queue"""
+
+    def __init__(self, file_queue, work_queue, chunk_size, stopped, time_range=None):
+        super().__init__(daemon=True)
+        self.file_queue = file_queue
+        self.work_queue = work_queue
+        self.chunk_size = chunk_size
+        self.stopped = stopped
+        self.keep = entry_filter(PIPELINE_KINDS, time_range)
+
+    def put(self, message):
+        # Blocks while the parsers are behind, unless the pipeline was abandoned
+        while not self.stopped.is_set():
+            try:
+                self.work_queue.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                position, file_path = self.file_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.read(position, file_path)
+            except Exception as e:
+                self.put(('failed', position, e))
+        self.put(None)
+
+    def read(self, position, file_path):
+        entry_count = 0
+        entries = []
+        with gzip.open(file_path, 'rt') as f:
+            for entry in iter_log_entries(f):
+                if not self.keep(entry):
+                    continue
+                entries.append(entry)
+                if len(entries) >= self.chunk_size:
+                    entry_count += len(entries)
+                    self.put(('chunk', position, entries))
+                    entries = []
+            if entries:
+                entry_count += len(entries)
+                self.put(('chunk', position, entries))
+            bytes_decompressed = f.buffer.tell()
+        self.put(('done', position, {'log_entries': entry_count, 'bytes_decompressed': bytes_decompressed}))
+
+
+def pipelined_log_files(file_paths, chunk_size=None, workers=1, readers=DEFAULT_READERS, queue_size=None,
+                        time_range=None):
+    """Yield (file_path, frames, error, stats) for each file, like _parse_log_files, with the stages overlapped.
+
+    Reader threads decompress files and split them into chunks of chunk_size candidate entries, a
+    pool of workers processes parses the chunks, and this generator reassembles each file's frames
+    and yields the files in the order given. At most queue_size chunks wait for a parser and at most
+    queue_size more are being parsed, so a slow stage holds back the ones before it instead of
+    letting unparsed text pile up in memory. With a (since, until) time_range, the readers drop
+    entries outside it.
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    queue_size = queue_size or 2 * workers
+    file_queue = queue.Queue()
+    for position, file_path in enumerate(file_paths):
+        file_queue.put((position, file_path))
+    work_queue = queue.Queue(maxsize=queue_size)
+    parse_slots = threading.BoundedSemaphore(queue_size)
+    stopped = threading.Event()
+    results = [_FileResult() for _ in file_paths]
+    next_position = 0
+
+    threads = [_Reader(file_queue, work_queue, chunk_size, stopped, time_range) for _ in range(max(1, readers))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for thread in threads:
+                thread.start()
+            running = len(threads)
+            while running or next_position < len(results):
+                if running:
+                    message = work_queue.get()
+                    if message is None:
+                        running -= 1
+                    else:
+                        kind, position, payload = message
+                        result = results[position]
+                        if kind == 'chunk':
+                            parse_slots.acquire()
+                            future = executor.submit(_parse_entries, payload)
+                            future.add_done_callback(lambda _: parse_slots.release())
+                            result.futures.append(future)
+                        elif kind == 'done':
+                            result.stats = payload
+                        else:
+                            result.error = payload
+                # Once the readers are finished, wait for the parsers of the next file in order
+                while next_position < len(results) and (results[next_position].done() or not running):
+                    for future in results[next_position].futures:
+                        future.exception()
+                    yield (file_paths[next_position],) + results[next_position].result()
+                    results[next_position] = None
+                    next_position += 1
+        finally:
+            stopped.set()
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from schema import plain_values
+
+BREAK_COLUMNS = ['userId', 'break_type', 'previous_request_id', 'previous_timestamp', 'request_id', 'timestamp',
+                 'expected_balance', 'actual_balance', 'difference']
+
+# Direction in which each transaction type moves the balance
+BALANCE_SIGNS = {'CREDIT': 1, 'DEBIT': -1}
+
+
+def _balances(values):
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _codes(values):
+    """Integer code per value, -1 for missing values"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy()
+    return pd.factorize(values)[0]
+
+
+def _signs(types):
+    if isinstance(types.dtype, pd.CategoricalDtype):
+        signs = np.array([BALANCE_SIGNS.get(t, np.nan) for t in types.cat.categories] + [np.nan])
+        return signs[types.cat.codes.to_numpy()]
+    return _balances(types.map(BALANCE_SIGNS))
+
+
+def reconcile_balances(parsed_df):
+    """Find the transactions that break a user's balance chain.
+
+    Each user's transactions are ordered by timestamp, with ties in log order. A 'chain' break is a
+    transaction whose oldBalance differs from the newBalance of the user's previous transaction. An
+    'amount' break is a transaction whose newBalance is not its oldBalance plus (CREDIT) or minus
+    (DEBIT) its amount. A comparison involving a missing value is not a break. Every break row holds
+    the request_id and timestamp of the transaction before it (if any) and of the transaction itself.
+    """
+    # Only the numeric columns are put in ledger order; other fields are looked up for the breaks
+    users = _codes(parsed_df['userId'])
+    timestamps = parsed_df['timestamp'].to_numpy(dtype='datetime64[ns]')
+    with_user = np.flatnonzero(users >= 0)
+    order = with_user[np.lexsort((timestamps[with_user], users[with_user]))]
+
+    users = users[order]
+    old_balance = _balances(parsed_df['oldBalance'])[order]
+    new_balance = _balances(parsed_df['newBalance'])[order]
+    expected_new_balance = old_balance + _signs(parsed_df['type'])[order] * _balances(parsed_df['amount'])[order]
+
+    has_previous = np.zeros(len(order), dtype=bool)
+    has_previous[1:] = users[1:] == users[:-1]
+    previous_new_balance = np.full(len(order), np.nan)
+    previous_new_balance[1:] = new_balance[:-1]
+    previous_new_balance[~has_previous] = np.nan
+
+    # NaN never compares equal, so rows with a missing value have to be masked out explicitly
+    checks = [
+        ('chain', previous_new_balance, old_balance),
+        ('amount', expected_new_balance, new_balance),
+    ]
+    breaks = []
+    for break_type, expected, actual in checks:
+        positions = np.flatnonzero(~np.isnan(expected) & ~np.isnan(actual) & (expected != actual))
+        breaks.append(pd.DataFrame({
+            'position': positions,
+            'break_type': break_type,
+            'expected_balance': expected[positions],
+            'actual_balance': actual[positions],
+        }))
+    breaks = pd.concat(breaks, ignore_index=True).sort_values('position', kind='mergesort')
+
+    positions = breaks['position'].to_numpy()
+    previous = has_previous[positions]
+    rows = parsed_df.iloc[order[positions]].reset_index(drop=True)
+    previous_rows = parsed_df.iloc[order[np.maximum(positions - 1, 0)]].reset_index(drop=True)
+    return pd.DataFrame({
+        'userId': plain_values(rows['userId']),
+        'break_type': breaks['break_type'].to_numpy(),
+        'previous_request_id': previous_rows['request_id'].where(previous),
+        'previous_timestamp': previous_rows['timestamp'].where(previous),
+        'request_id': rows['request_id'],
+        'timestamp': rows['timestamp'],
+        'expected_balance': breaks['expected_balance'].to_numpy(),
+        'actual_balance': breaks['actual_balance'].to_numpy(),
+        'difference': (breaks['actual_balance'] - breaks['expected_balance']).to_numpy(),
+    }, columns=BREAK_COLUMNS)
@@ -0,0 +1,77 @@
+import os
+
+from aggregates import counts
+from anomalies import DEFAULT_FREQUENCY
+
+REPORT_FILE_NAME = "balance_sync_analytics_report.xlsx"
+
+TRANSACTIONS_ARTIFACT = "transactions.parquet"
+ERRORS_ARTIFACT = "errors.parquet"
+USER_ANALYSIS_ARTIFACT = "user_analysis.parquet"
+REQUEST_INDEX_ARTIFACT = "request_index.parquet"
+
+
+def report_stage(parsed_df, error_df, user_analysis_df, output_dir, parquet=False, chart_workers=1,
+                 chart_format='png', cube=None, request_index=None, anomaly_frequency=DEFAULT_FREQUENCY,
+                 sqlite_path=None):
+    # Plotting and Excel libraries are only imported by the stage that needs them
+    from analysis import run_complete_analysis
+    from reports.excel_report import ExcelReportBuilder, add_report_data
+
+    os.makedirs(output_dir, exist_ok=True)
+    if parquet:
+        from reports.parquet_export import export_parquet
+        export_parquet(parsed_df, error_df, user_analysis_df, output_dir)
+    if sqlite_path:
+        from sqlite_store import write_store
+        write_store(sqlite_path, parsed_df, error_df, user_analysis_df, request_index)
+        print(f"Wrote SQLite store: {sqlite_path}")
+    report = ExcelReportBuilder(os.path.join(output_dir, REPORT_FILE_NAME))
+    add_report_data(report, parsed_df, error_df, user_analysis_df)
+    run_complete_analysis(parsed_df, error_df, user_analysis_df, output_dir, REPORT_FILE_NAME,
+                          report=report, cube=cube, chart_workers=chart_workers, chart_format=chart_format,
+                          request_index=request_index, anomaly_frequency=anomaly_frequency)
+    report.save()
+
+
+def chart_report_stage(cube, output_dir, chart_workers=1, user_analysis_df=None):
+    """Write a report with the charts that can be drawn from the cube and, if given, the user analysis"""
+    from analysis import run_complete_analysis
+    from reports.excel_report import ExcelReportBuilder
+
+    os.makedirs(output_dir, exist_ok=True)
+    report = ExcelReportBuilder(os.path.join(output_dir, REPORT_FILE_NAME))
+    if user_analysis_df is not None:
+        report.add_frame(user_analysis_df, "user_wise_error_analysis_data")
+    run_complete_analysis(None, None, None, output_dir, REPORT_FILE_NAME, report=report, cube=cube,
+                          chart_workers=chart_workers)
+    report.save()
+
+
+def print_summary(cube):
+    if 'totals' in cube:
+        # Streaming summaries only keep the top users, so totals and distinct users are stored separately
+        totals = cube['totals'].iloc[0]
+        print(f"Transactions: {totals['transactions']}")
+        print(f"Error transactions: {totals['error_transactions']}")
+        print(f"Users with errors (estimated): {totals['distinct_error_users']}")
+    else:
+        print(f"Transactions: {cube['user_transactions']['count'].sum()}")
+        print(f"Error transactions: {cube['user_errors']['count'].sum()}")
+        print(f"Users with errors: {len(cube['user_errors'])}")
+    if 'losses' in cube:
+        losses = cube['losses'].iloc[0]
+        print(f"Total debit loss: {losses['Total_debit_loss']:,.2f}")
+        print(f"Total credit loss: {losses['Total_credit_loss']:,.2f}")
+    if 'balance_breaks' in cube:
+        breaks = cube['balance_breaks']
+        print(f"Balance breaks: {len(breaks)} ({breaks['userId'].nunique()} users)")
+    print("Error transactions per day:")
+    for date, count in counts(cube, 'daily_errors', 'date').items():
+        print(f"  {date}: {count}")
+    if 'error_rate' in cube:
+        error_rate = cube['error_rate']
+        anomalies = error_rate[error_rate['anomaly']]
+        print(f"Error rate anomalies: {len(anomalies)}")
+        for bucket, count, baseline in zip(anomalies['bucket'], anomalies['error_count'], anomalies['baseline']):
+            print(f"  {bucket}: {count} errors (baseline {baseline:.1f})")
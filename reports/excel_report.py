@@ -2,30 +2,143 @@ import os
 
 import pandas as pd
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, Reference
+from openpyxl.chart.marker import DataPoint
 from openpyxl.drawing.image import Image
+from openpyxl.styles import Alignment, Border, Font, Side
 
+EXCEL_MAX_ROWS = 1_048_576
 
-def write_to_sheet(df, sheet_name, file_path):
-    for col in df.select_dtypes(include=['datetimetz']).columns:
-        df[col] = df[col].dt.tz_localize(None)
+WRITE_BATCH_ROWS = 50_000
 
-    if os.path.exists(file_path):
-        with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    else:
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+CHART_DATA_SHEET = 'chart_data'
+
+_THIN = Side(style='thin')
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+
+class ExcelReportBuilder:
+    """Assembles data sheets and charts of one workbook and writes it with a single save.
+
+    In write-only mode rows are streamed to openpyxl as they are added, so memory does not grow
+    with the workbook. Frames longer than the Excel row limit continue on numbered sheets
+    (transaction_data, transaction_data_2, ...).
+    """
+
+    def __init__(self, file_path, write_only=True):
+        self.file_path = file_path
+        self.write_only = write_only
+        self.workbook = Workbook(write_only=write_only)
+        if not write_only:
+            self.workbook.remove(self.workbook.active)
+        self.sheets = {}
+        self._chart_data_rows = 0
+
+    def _get_sheet(self, sheet_name):
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = self.workbook.create_sheet(sheet_name)
+        return self.sheets[sheet_name]
+
+    def _header_row(self, worksheet, columns):
+        row = []
+        for name in columns:
+            cell = WriteOnlyCell(worksheet, value=str(name)) if self.write_only else str(name)
+            if self.write_only:
+                cell.font = HEADER_FONT
+                cell.border = HEADER_BORDER
+                cell.alignment = HEADER_ALIGNMENT
+            row.append(cell)
+        return row
+
+    def add_frame(self, df, sheet_name):
+        """Write df to sheet_name, splitting it across numbered sheets if needed; returns the sheet names"""
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+        sheet_count = max(1, -(-len(df) // rows_per_sheet))
+        sheet_names = [sheet_name] + [f"{sheet_name}_{i}" for i in range(2, sheet_count + 1)]
+
+        for i, name in enumerate(sheet_names):
+            worksheet = self._get_sheet(name)
+            worksheet.append(self._header_row(worksheet, df.columns))
+            part = df.iloc[i * rows_per_sheet:(i + 1) * rows_per_sheet]
+            for start in range(0, len(part), WRITE_BATCH_ROWS):
+                for row in _excel_rows(part.iloc[start:start + WRITE_BATCH_ROWS]):
+                    worksheet.append(row)
+        return sheet_names
+
+    def add_image(self, sheet_name, image_path, cell):
+        self._get_sheet(sheet_name).add_image(Image(image_path), cell)
+
+    def add_bar_chart(self, sheet_name, cell, title, values, x_title=None, y_title=None, horizontal=False,
+                      highlight=()):
+        """Add a native Excel bar chart of a Series, keeping its data in the chart_data sheet"""
+        worksheet = self._get_sheet(sheet_name)
+        data_sheet = self._get_sheet(CHART_DATA_SHEET)
+
+        header_row = self._chart_data_rows + 1
+        data_sheet.append([x_title or '', title])
+        for label, value in zip(values.index, values.tolist()):
+            data_sheet.append([str(label), value])
+        data_sheet.append([])
+        self._chart_data_rows += len(values) + 2
+
+        chart = BarChart()
+        chart.type = 'bar' if horizontal else 'col'
+        chart.title = title
+        chart.x_axis.title = x_title
+        chart.y_axis.title = y_title
+        chart.legend = None
+        chart.width = 18
+        chart.height = 10
+        chart.add_data(Reference(data_sheet, min_col=2, min_row=header_row, max_row=header_row + len(values)),
+                       titles_from_data=True)
+        chart.set_categories(Reference(data_sheet, min_col=1, min_row=header_row + 1,
+                                       max_row=header_row + len(values)))
+        for index in highlight:
+            point = DataPoint(idx=index)
+            point.graphicalProperties.solidFill = 'FF0000'
+            chart.series[0].dPt.append(point)
+        worksheet.add_chart(chart, cell)
+
+    def save(self):
+        if CHART_DATA_SHEET in self.sheets:
+            data_sheet = self.sheets[CHART_DATA_SHEET]
+            self.workbook.move_sheet(CHART_DATA_SHEET, len(self.workbook.sheetnames) - 1 - self.workbook.index(data_sheet))
+        self.workbook.save(self.file_path)
+
+
+def _excel_rows(df):
+    columns = []
+    for name in df.columns:
+        values = df[name]
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_localize(None)
+        columns.append(values.astype(object).where(values.notna(), None))
+    return zip(*columns)
+
+
+def add_report_data(report, parsed_df, error_df, analysis_df):
+    report.add_frame(analysis_df, "user_wise_error_analysis_data")
+    report.add_frame(parsed_df, "transaction_data")
+    report.add_frame(error_df, "error_data")
 
 
 def generate_excel(parsed_df, error_df, analysis_df, output_excel_file_name, output_excel_file_path):
     full_path = os.path.join(output_excel_file_path, output_excel_file_name)
 
-    write_to_sheet(analysis_df, "user_wise_error_analysis_data", full_path)
-    write_to_sheet(parsed_df, "transaction_data", full_path)
-    write_to_sheet(error_df, "error_data", full_path)
+    report = ExcelReportBuilder(full_path)
+    add_report_data(report, parsed_df, error_df, analysis_df)
+    report.save()
+
 
+def insert_chart_to_excel(output_excel_file_path, output_excel_file_name, sheet_name, image_path, cell,
+                          report=None):
+    if report is not None:
+        report.add_image(sheet_name, image_path, cell)
+        return
 
-def insert_chart_to_excel(output_excel_file_path, output_excel_file_name, sheet_name, image_path, cell):
     full_path = os.path.join(output_excel_file_path, output_excel_file_name)
     if os.path.exists(full_path):
         workbook = load_workbook(full_path)
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+PARQUET_DIR = 'parquet'
+
+DICTIONARY_COLUMNS = {
+    'transactions': ['type', 'source', 'action', 'userId', 'metadata', 'currency'],
+    'errors': ['userId'],
+    'user_analysis': ['First_error_transaction_reason'],
+}
+
+PARTITIONED_TABLES = ['transactions', 'errors']
+
+
+def _to_arrow(df, dictionary_columns):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name in dictionary_columns:
+        if name not in table.column_names:
+            continue
+        index = table.column_names.index(name)
+        column = table.column(index)
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            table = table.set_column(index, name, pc.dictionary_encode(column))
+    return table
+
+
+def export_table(df, table_name, output_dir):
+    root = os.path.join(output_dir, PARQUET_DIR, table_name)
+    if table_name in PARTITIONED_TABLES:
+        df = df.assign(date=pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d'))
+        table = _to_arrow(df, DICTIONARY_COLUMNS[table_name])
+        # Partitions of dates missing from this run would otherwise be left behind
+        shutil.rmtree(root, ignore_errors=True)
+        if table.num_rows:
+            pq.write_to_dataset(table, root, partition_cols=['date'], basename_template='part-{i}.parquet')
+        else:
+            # write_to_dataset writes no files for an empty table; keep one with the schema for readers
+            os.makedirs(root)
+            pq.write_table(table, os.path.join(root, 'part-0.parquet'))
+    else:
+        os.makedirs(root, exist_ok=True)
+        table = _to_arrow(df, DICTIONARY_COLUMNS[table_name])
+        pq.write_table(table, os.path.join(root, 'part-0.parquet'))
+    return root
+
+
+def export_parquet(parsed_df, error_df, analysis_df, output_dir):
+    """Write the transaction and error frames as date-partitioned Parquet datasets, plus user analysis"""
+    export_table(parsed_df, 'transactions', output_dir)
+    export_table(error_df, 'errors', output_dir)
+    export_table(analysis_df, 'user_analysis', output_dir)
+
+
+def read_parquet_export(output_dir, table_name, start_date=None, end_date=None, columns=None):
+    """Load one exported table, reading only the date partitions and columns requested.
+
+    start_date and end_date are inclusive 'YYYY-MM-DD' strings and only apply to partitioned tables,
+    whose rows come back grouped by date partition.
+    """
+    root = os.path.join(output_dir, PARQUET_DIR, table_name)
+    filters = []
+    if start_date is not None:
+        filters.append(('date', '>=', str(start_date)))
+    if end_date is not None:
+        filters.append(('date', '<=', str(end_date)))
+
+    table = pq.read_table(root, columns=columns, filters=filters or None,
+                          partitioning='hive' if table_name in PARTITIONED_TABLES else None)
+    df = table.to_pandas()
+    if 'date' in df.columns and (columns is None or 'date' not in columns):
+        df = df.drop(columns='date')
+
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype(df[name].cat.categories.dtype)
+    return df
@@ -0,0 +1,54 @@
+import pandas as pd
+
+INDEX_FIELDS = ['userId', 'timestamp', 'type', 'action', 'source']
+
+
+def build_request_index(parsed_df):
+    """Map every (userId, request_id) pair to the one transaction errors of that user and request_id are attributed to.
+
+    A request_id can be shared by the transactions of several users (one invocation handling a batch),
+    so the index is keyed by request_id and userId together. Rows without a request_id are left out.
+    When a pair occurs more than once, the earliest transaction wins and ties keep log order, so the
+    index is the same however often it is rebuilt. Rows are in timestamp order, indexed by request_id.
+    """
+    transactions = parsed_df.loc[parsed_df['request_id'].notna(), ['request_id'] + INDEX_FIELDS]
+    transactions = transactions.sort_values('timestamp', kind='mergesort')
+    return transactions.drop_duplicates(subset=['userId', 'request_id'], keep='first').set_index('request_id')
+
+
+def lookup_transaction(request_index, request_id, user_id=None):
+    """Return the indexed transaction for request_id, or None.
+
+    With a user_id, only that user's transaction counts as a match; without one, the earliest
+    transaction of the request_id across all users is returned.
+    """
+    if pd.isna(request_id) or request_id not in request_index.index:
+        return None
+    candidates = request_index.loc[[request_id]]
+    if user_id is not None:
+        candidates = candidates[candidates['userId'] == user_id]
+    return candidates.iloc[0] if len(candidates) else None
+
+
+def lookup_transactions(request_index, request_ids, user_ids=None):
+    """Vectorized lookup_transaction: the indexed fields for each request_id, aligned to request_ids.
+
+    With user_ids, each request_id is looked up together with its user; without, the earliest
+    transaction of the request_id across all users is used (e.g. to count errors per action).
+    Rows without a match are all NaN. The returned frame has a boolean 'matched' column.
+    """
+    request_ids = pd.Series(request_ids)
+    if user_ids is None:
+        index = request_index[~request_index.index.duplicated(keep='first')]
+        positions = index.index.get_indexer(request_ids)
+    else:
+        index = request_index
+        user_ids = pd.Series(user_ids).to_numpy(dtype=object)
+        keys = pd.MultiIndex.from_arrays([index['userId'].to_numpy(dtype=object), index.index.to_numpy(dtype=object)])
+        positions = keys.get_indexer(pd.MultiIndex.from_arrays([user_ids, request_ids.to_numpy(dtype=object)]))
+        # A missing userId never matches, not even a transaction without one
+        positions[pd.isna(user_ids)] = -1
+    found = index.reset_index(drop=True).reindex(positions)
+    found.index = request_ids.index
+    found['matched'] = positions >= 0
+    return found
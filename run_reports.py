@@ -1,59 +1,163 @@
 import argparse
 import gzip
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import pandas as pd
 
-from analysis import run_complete_analysis
-from parser import parse_logs, parse_balance_sync_message, parse_transaction
-from reports.excel_report import generate_excel
-from user_analysis import analyze_all_users
+from aggregates import (CUBE_DIR, DEFAULT_TOP_K, StreamingSummary, build_aggregate_cube, load_aggregate_cube,
+                        save_aggregate_cube)
+from anomalies import DEFAULT_FREQUENCY, FREQUENCIES
+from cache import ParseCache
+from dedup import DEDUP_MODES, DEFAULT_BLOOM_CAPACITY, Deduplicator
+from ingest import (combine_parsed, count_stats, find_log_files, generate_error_data, generate_transaction_data,
+                    iter_parsed_chunks, parse_log_file)
+from instrumentation import RunInstrumentation
+from parser import DEFAULT_CHUNK_SIZE, PIPELINE_COLUMNS, PIPELINE_KINDS, parse_logs
+from pipeline import DEFAULT_READERS, pipelined_log_files
+from reporting import (ERRORS_ARTIFACT, REQUEST_INDEX_ARTIFACT, TRANSACTIONS_ARTIFACT, USER_ANALYSIS_ARTIFACT,
+                       chart_report_stage, print_summary, report_stage)
+from request_index import build_request_index
+from sharding import (analyze_shard, analyze_shard_frames, analyze_sharded, read_shard_partition, read_shard_results,
+                      remove_shard_outputs, write_shard_partitions, write_shard_result)
+from time_index import TIME_INDEX_FILE, TimeIndex, parse_time_bound, select_time_range
+from user_analysis import analyze_all_users, analyze_all_users_vectorized
+from watch import watch
 
+RUN_SUMMARY_FILE = "run_summary.json"
+PROFILE_DIR = "profiles"
 
-def generate_transaction_data(df):
-    records = []
+COMMANDS = ['parse', 'analyze', 'report', 'all', 'summarize', 'watch', 'query']
 
-    for ind, row in df.iterrows():
-        parsed_message = parse_transaction(row['message'])
-        if parsed_message != dict():
-            parsed_message['request_id'] = row['dup_request_id']
-            parsed_message['timestamp'] = row['timestamp']
-            records.append(parsed_message)
-    parsed_df = pd.DataFrame(records)
-    parsed_df['timestamp'] = pd.to_datetime(parsed_df['timestamp'])
-    return parsed_df
 
+def _try_parse_log_file(file_path, chunk_size, time_range=None):
+    stats = {}
+    try:
+        return parse_log_file(file_path, chunk_size, stats, time_range), None, stats
+    except Exception as e:
+        return None, e, stats
 
-def generate_error_data(df):
-    records = []
-    for ind, row in df.iterrows():
-        parsed_message = parse_balance_sync_message(row['message'])
-        if parsed_message != dict():
-            parsed_message['request_id'] = row['dup_request_id']
-            parsed_message['timestamp'] = row['timestamp']
-            records.append(parsed_message)
-    error_df = pd.DataFrame(records)
-    error_df['timestamp'] = pd.to_datetime(error_df['timestamp'])
-    return error_df
 
+def _try_summarize_log_file(file_path, chunk_size, top_k, anomaly_frequency):
+    stats = {}
+    try:
+        return summarize_log_file(file_path, chunk_size, top_k, anomaly_frequency, stats), None, stats
+    except Exception as e:
+        return None, e, stats
 
-def main(input_dir: str, output_dir: str):
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
 
+def _parse_log_files(file_paths, chunk_size=None, workers=1, parse=_try_parse_log_file, *args):
+    """Yield (file_path, result, error, stats) for each file, in the order given"""
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(parse, file_paths, repeat(chunk_size), *[repeat(arg) for arg in args])
+            for file_path, result in zip(file_paths, results):
+                yield (file_path,) + result
+    else:
+        for file_path in file_paths:
+            yield (file_path,) + parse(file_path, chunk_size, *args)
+
+
+def _read_log_files(file_paths, chunk_size=None, workers=1, pipeline=None, time_range=None):
+    if pipeline is not None:
+        return pipelined_log_files(file_paths, chunk_size, workers, time_range=time_range, **pipeline)
+    return _parse_log_files(file_paths, chunk_size, workers, _try_parse_log_file, time_range)
+
+
+def collect_log_data(input_dir, chunk_size=None, workers=1, cache=None, stats=None, pipeline=None, dedup=None,
+                     time_range=None, time_index=None):
+    """Parse log files one at a time, optionally in a process pool and through a ParseCache.
+
+    With pipeline, a dict of pipelined_log_files options, reading and parsing overlap in the pipeline.
+    With dedup, a dict of Deduplicator options, entries repeated across files (overlapping exports)
+    are dropped. With a (since, until) time_range, only rows in that range are kept: files the
+    TimeIndex places outside it are skipped, files it does not know yet are read in full once to
+    index them, and entries of the others are filtered before they are parsed. Results are merged
+    in directory walk order, so every combination of options produces the same frames as a serial run.
+    """
+    file_paths = list(find_log_files(input_dir))
+    file_frames = {}
+    unindexed = []
+
+    if time_range is not None:
+        selected, unindexed = time_index.select(file_paths, *time_range)
+        print(f"Skipped {len(file_paths) - len(selected)} files outside the time range")
+        if stats is not None:
+            count_stats(stats, files_skipped=len(file_paths) - len(selected))
+        file_paths = selected
+
+    if cache is not None:
+        for file_path in file_paths:
+            frames = cache.lookup(file_path)
+            if frames is not None:
+                print(f"Cached: {file_path}")
+                file_frames[file_path] = frames
+                if stats is not None:
+                    count_stats(stats, files_cached=1)
+
+    to_parse = [file_path for file_path in file_paths if file_path not in file_frames]
+    # Files parsed with a time range only hold part of their rows, so they are not cached
+    batches = [([file_path for file_path in to_parse if file_path in unindexed], None),
+               ([file_path for file_path in to_parse if file_path not in unindexed], time_range)]
+    for batch, batch_range in batches:
+        if not batch:
+            continue
+        for file_path, frames, error, file_stats in _read_log_files(batch, chunk_size, workers, pipeline, batch_range):
+            print(f"Reading: {file_path}")
+            if stats is not None:
+                count_stats(stats, files_read=1, **file_stats)
+            if error is not None:
+                print(f"Failed to read {file_path}: {error}")
+                if stats is not None:
+                    count_stats(stats, files_failed=1)
+                continue
+            file_frames[file_path] = frames
+            if cache is not None and batch_range is None:
+                cache.store(file_path, *frames)
+
+    if cache is not None:
+        cache.save()
+    if time_range is not None:
+        for file_path in unindexed:
+            if file_path in file_frames:
+                time_index.record(file_path, *file_frames[file_path])
+        time_index.save()
+
+    ordered = [file_frames[file_path] for file_path in file_paths if file_path in file_frames]
+    if time_range is not None:
+        ordered = [tuple(select_time_range(df, *time_range) for df in frames) for frames in ordered]
+    if dedup is not None:
+        ordered = drop_duplicate_entries(ordered, stats, **dedup)
+    return combine_parsed(ordered)
+
+
+def drop_duplicate_entries(ordered, stats=None, **options):
+    """Drop the transactions and errors of each file's frames already seen in an earlier file or row"""
+    transactions, errors = Deduplicator(**options), Deduplicator(**options)
+    ordered = [(transactions.drop_duplicates(frames[0]), errors.drop_duplicates(frames[1])) for frames in ordered]
+    print(f"Removed {transactions.duplicates} duplicate transactions and {errors.duplicates} duplicate errors")
+    if stats is not None:
+        count_stats(stats, duplicate_transactions=transactions.duplicates, duplicate_errors=errors.duplicates)
+    return ordered
+
+
+def load_log_data(input_dir, stats=None):
     dfs = []
 
-    for dir_path, dir_names, file_names in os.walk(input_dir):
-        for file_name in file_names:
-            if file_name.endswith('.gz'):
-                file_path = os.path.join(dir_path, file_name)
-                print(f"Reading: {file_path}")
-                with gzip.open(file_path, 'rt') as f:
-                    try:
-                        log_text = f.read()
-                        dfs.append(parse_logs(log_text))
-                    except Exception as e:
-                        print(f"Failed to read {file_path}: {e}")
+    for file_path in find_log_files(input_dir):
+        print(f"Reading: {file_path}")
+        with gzip.open(file_path, 'rt') as f:
+            try:
+                log_text = f.read()
+                dfs.append(parse_logs(log_text, PIPELINE_KINDS, PIPELINE_COLUMNS))
+                if stats is not None:
+                    count_stats(stats, files_read=1, log_entries=len(dfs[-1]), bytes_decompressed=f.buffer.tell())
+            except Exception as e:
+                print(f"Failed to read {file_path}: {e}")
+                if stats is not None:
+                    count_stats(stats, files_read=1, files_failed=1)
 
     if dfs:
         all_data = pd.concat(dfs, ignore_index=True)
@@ -64,15 +168,409 @@ def main(input_dir: str, output_dir: str):
 
     parsed_df = generate_transaction_data(all_data)
     error_df = generate_error_data(all_data[all_data['log_level'] == 'ERROR'])
+    return parsed_df, error_df
 
-    user_analysis_df = analyze_all_users(error_df, parsed_df)
-    generate_excel(parsed_df, error_df, user_analysis_df, "balance_sync_analytics_report.xlsx", output_dir)
-    run_complete_analysis(parsed_df, error_df, user_analysis_df, output_dir, "balance_sync_analytics_report.xlsx")
 
+def summarize_log_file(file_path, chunk_size=DEFAULT_CHUNK_SIZE, top_k=DEFAULT_TOP_K,
+                       anomaly_frequency=DEFAULT_FREQUENCY, stats=None):
+    """Fold one .gz file chunk by chunk into a StreamingSummary without keeping the parsed rows"""
+    summary = StreamingSummary(top_k, anomaly_frequency)
+    for transactions, errors in iter_parsed_chunks(file_path, chunk_size, stats):
+        summary.update(transactions, errors)
+    return summary
 
-if __name__ == "__main__":
+
+def summarize_log_data(input_dir, chunk_size=None, workers=1, top_k=DEFAULT_TOP_K,
+                       anomaly_frequency=DEFAULT_FREQUENCY, stats=None):
+    """Streaming aggregation: merge one StreamingSummary per file, in memory bounded by chunk_size and top_k"""
+    summary = StreamingSummary(top_k, anomaly_frequency)
+    file_paths = list(find_log_files(input_dir))
+    for file_path, file_summary, error, file_stats in _parse_log_files(
+            file_paths, chunk_size or DEFAULT_CHUNK_SIZE, workers, _try_summarize_log_file, top_k, anomaly_frequency):
+        print(f"Reading: {file_path}")
+        if stats is not None:
+            count_stats(stats, files_read=1, **file_stats)
+        if error is not None:
+            print(f"Failed to read {file_path}: {error}")
+            if stats is not None:
+                count_stats(stats, files_failed=1)
+            continue
+        summary.merge(file_summary)
+    return summary
+
+
+def parse_stage(input_dir, chunk_size=None, workers=1, cache_dir=None, stats=None, pipeline=None, dedup=None,
+                time_range=None, time_index_path=None):
+    """Parse the input logs into transaction and error frames plus the request_id index.
+
+    A time_range is looked up in the TimeIndex at time_index_path. The commands keep it next to their
+    artifacts or outputs, so the input archive can be read-only.
+    """
+    if time_range is not None and time_index_path is None:
+        raise ValueError("A time range needs a time index path")
+    if chunk_size or workers > 1 or cache_dir or pipeline is not None or dedup is not None or time_range is not None:
+        cache = ParseCache(cache_dir) if cache_dir else None
+        time_index = None
+        if time_range is not None:
+            time_index = TimeIndex(time_index_path)
+        parsed_df, error_df = collect_log_data(input_dir, chunk_size, workers, cache, stats, pipeline, dedup,
+                                               time_range, time_index)
+    else:
+        parsed_df, error_df = load_log_data(input_dir, stats)
+    return parsed_df, error_df, build_request_index(parsed_df)
+
+
+def analyze_stage(parsed_df, error_df, user_engine='vectorized', request_index=None, shards=1):
+    if shards > 1:
+        return analyze_sharded(error_df, parsed_df, shards, user_engine, request_index)
+    if user_engine == 'vectorized':
+        return analyze_all_users_vectorized(error_df, parsed_df, request_index)
+    return analyze_all_users(error_df, parsed_df, request_index)
+
+
+def read_request_index(artifacts_dir):
+    """Load the request_id index written by the parse command, or None for older artifacts"""
+    index_path = os.path.join(artifacts_dir, REQUEST_INDEX_ARTIFACT)
+    return pd.read_parquet(index_path) if os.path.exists(index_path) else None
+
+
+def main(input_dir: str, output_dir: str, chunk_size: int = None, workers: int = 1,
+         user_engine: str = 'vectorized', cache_dir: str = None, parquet: bool = False, chart_workers: int = 1,
+         chart_format: str = 'png', profile: bool = False, anomaly_frequency: str = DEFAULT_FREQUENCY,
+         pipeline: dict = None, shards: int = 1, dedup: dict = None, time_range: tuple = None,
+         time_index_path: str = None, sqlite_path: str = None):
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    instrumentation = RunInstrumentation('all', _profile_dir(output_dir, profile))
+
+    with instrumentation.stage('parse') as record:
+        parsed_df, error_df, request_index = parse_stage(input_dir, chunk_size, workers, cache_dir, stats=record,
+                                                         pipeline=pipeline, dedup=dedup, time_range=time_range,
+                                                         time_index_path=time_index_path or
+                                                         os.path.join(output_dir, TIME_INDEX_FILE))
+        _record_rows(record, rows_out=(parsed_df, error_df))
+    with instrumentation.stage('analyze') as record:
+        user_analysis_df = analyze_stage(parsed_df, error_df, user_engine, request_index, shards)
+        _record_rows(record, rows_in=(parsed_df, error_df), rows_out=(user_analysis_df,))
+    with instrumentation.stage('report') as record:
+        report_stage(parsed_df, error_df, user_analysis_df, output_dir, parquet, chart_workers, chart_format,
+                     request_index=request_index, anomaly_frequency=anomaly_frequency, sqlite_path=sqlite_path)
+        _record_rows(record, rows_in=(parsed_df, error_df, user_analysis_df))
+
+    instrumentation.write_summary(os.path.join(output_dir, RUN_SUMMARY_FILE))
+
+
+def _profile_dir(output_dir, profile):
+    return os.path.join(output_dir, PROFILE_DIR) if profile else None
+
+
+def _pipeline_options(args):
+    return {'readers': args.readers, 'queue_size': args.queue_size} if args.pipeline else None
+
+
+def _dedup_options(args):
+    return {'mode': args.dedup, 'capacity': args.bloom_capacity} if args.dedup else None
+
+
+def _time_range(args):
+    return (args.since, args.until) if args.since is not None or args.until is not None else None
+
+
+def _parse_artifact_paths(artifacts_dir):
+    artifacts = (TRANSACTIONS_ARTIFACT, ERRORS_ARTIFACT, REQUEST_INDEX_ARTIFACT)
+    return [os.path.join(artifacts_dir, name) for name in artifacts]
+
+
+def _record_rows(record, rows_in=(), rows_out=()):
+    if rows_in:
+        record['rows_in'] = sum(len(df) for df in rows_in)
+    if rows_out:
+        record['rows_out'] = sum(len(df) for df in rows_out)
+
+
+def run_parse_command(args):
+    os.makedirs(args.artifacts_dir, exist_ok=True)
+    instrumentation = RunInstrumentation('parse', _profile_dir(args.artifacts_dir, args.profile))
+    with instrumentation.stage('parse') as record:
+        parsed_df, error_df, request_index = parse_stage(args.input_dir, args.chunk_size, args.workers,
+                                                         args.cache_dir, stats=record,
+                                                         pipeline=_pipeline_options(args),
+                                                         dedup=_dedup_options(args), time_range=_time_range(args),
+                                                         time_index_path=args.time_index or
+                                                         os.path.join(args.artifacts_dir, TIME_INDEX_FILE))
+        parsed_df.to_parquet(os.path.join(args.artifacts_dir, TRANSACTIONS_ARTIFACT), index=False)
+        error_df.to_parquet(os.path.join(args.artifacts_dir, ERRORS_ARTIFACT), index=False)
+        request_index.to_parquet(os.path.join(args.artifacts_dir, REQUEST_INDEX_ARTIFACT))
+        remove_shard_outputs(args.artifacts_dir)
+        if args.shards > 1:
+            write_shard_partitions(error_df, parsed_df, request_index, args.artifacts_dir, args.shards,
+                                   _parse_artifact_paths(args.artifacts_dir))
+        _record_rows(record, rows_out=(parsed_df, error_df))
+    print(f"Wrote {len(parsed_df)} transactions and {len(error_df)} errors to {args.artifacts_dir}")
+    instrumentation.write_summary(os.path.join(args.artifacts_dir, f"parse_{RUN_SUMMARY_FILE}"))
+
+
+def run_analyze_command(args):
+    if args.shard is not None:
+        run_analyze_shard_command(args)
+        return
+    instrumentation = RunInstrumentation('analyze', _profile_dir(args.artifacts_dir, args.profile))
+    with instrumentation.stage('analyze') as record:
+        parsed_df = pd.read_parquet(os.path.join(args.artifacts_dir, TRANSACTIONS_ARTIFACT))
+        error_df = pd.read_parquet(os.path.join(args.artifacts_dir, ERRORS_ARTIFACT))
+        request_index = read_request_index(args.artifacts_dir)
+        if args.merge_shards:
+            user_analysis_df = read_shard_results(args.artifacts_dir, args.shards)
+        else:
+            user_analysis_df = analyze_stage(parsed_df, error_df, args.user_engine, request_index, args.shards)
+        user_analysis_df.to_parquet(os.path.join(args.artifacts_dir, USER_ANALYSIS_ARTIFACT), index=False)
+        cube = build_aggregate_cube(parsed_df, error_df, user_analysis_df, request_index, args.anomaly_frequency)
+        save_aggregate_cube(cube, os.path.join(args.artifacts_dir, CUBE_DIR))
+        _record_rows(record, rows_in=(parsed_df, error_df), rows_out=(user_analysis_df,))
+    print_summary(cube)
+    instrumentation.write_summary(os.path.join(args.artifacts_dir, f"analyze_{RUN_SUMMARY_FILE}"))
+
+
+def run_analyze_shard_command(args):
+    """One job of a multi-node user analysis; a final `analyze --merge-shards` combines the shards"""
+    if not 0 <= args.shard < args.shards:
+        raise ValueError(f"--shard must be between 0 and {args.shards - 1}")
+    instrumentation = RunInstrumentation('analyze', _profile_dir(args.artifacts_dir, args.profile))
+    with instrumentation.stage(f'analyze_shard_{args.shard}') as record:
+        partition = read_shard_partition(args.artifacts_dir, args.shard, args.shards,
+                                         _parse_artifact_paths(args.artifacts_dir))
+        if partition is not None:
+            error_df, parsed_df, request_index = partition
+            result = analyze_shard_frames(error_df, parsed_df, request_index, args.user_engine)
+        else:
+            print(f"No partitions into {args.shards} shards of the current artifacts (parse --shards {args.shards}); "
+                  "reading all rows")
+            parsed_df = pd.read_parquet(os.path.join(args.artifacts_dir, TRANSACTIONS_ARTIFACT))
+            error_df = pd.read_parquet(os.path.join(args.artifacts_dir, ERRORS_ARTIFACT))
+            request_index = read_request_index(args.artifacts_dir)
+            result = analyze_shard(error_df, parsed_df, args.shard, args.shards, args.user_engine, request_index)
+        write_shard_result(result, args.artifacts_dir, args.shard, args.shards)
+        _record_rows(record, rows_in=(parsed_df, error_df), rows_out=(result,))
+    print(f"Wrote user analysis shard {args.shard} of {args.shards} ({len(result)} users)")
+    instrumentation.write_summary(os.path.join(args.artifacts_dir, f"analyze_shard_{args.shard}_{RUN_SUMMARY_FILE}"))
+
+
+def run_report_command(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    instrumentation = RunInstrumentation('report', _profile_dir(args.output_dir, args.profile))
+    with instrumentation.stage('report') as record:
+        parsed_df = pd.read_parquet(os.path.join(args.artifacts_dir, TRANSACTIONS_ARTIFACT))
+        error_df = pd.read_parquet(os.path.join(args.artifacts_dir, ERRORS_ARTIFACT))
+        user_analysis_df = pd.read_parquet(os.path.join(args.artifacts_dir, USER_ANALYSIS_ARTIFACT))
+        cube_dir = os.path.join(args.artifacts_dir, CUBE_DIR)
+        cube = load_aggregate_cube(cube_dir) if os.path.isdir(cube_dir) else None
+        request_index = read_request_index(args.artifacts_dir) if cube is None else None
+        report_stage(parsed_df, error_df, user_analysis_df, args.output_dir, args.parquet, args.chart_workers,
+                     args.chart_format, cube=cube, request_index=request_index, sqlite_path=args.sqlite)
+        _record_rows(record, rows_in=(parsed_df, error_df, user_analysis_df))
+    instrumentation.write_summary(os.path.join(args.output_dir, f"report_{RUN_SUMMARY_FILE}"))
+
+
+def run_all_command(args):
+    main(args.input_dir, args.output_dir, chunk_size=args.chunk_size, workers=args.workers,
+         user_engine=args.user_engine, cache_dir=args.cache_dir, parquet=args.parquet,
+         chart_workers=args.chart_workers, chart_format=args.chart_format, profile=args.profile,
+         anomaly_frequency=args.anomaly_frequency, pipeline=_pipeline_options(args), shards=args.shards,
+         dedup=_dedup_options(args), time_range=_time_range(args), time_index_path=args.time_index,
+         sqlite_path=args.sqlite)
+
+
+def run_summarize_command(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    instrumentation = RunInstrumentation('summarize', _profile_dir(args.output_dir, args.profile))
+    with instrumentation.stage('summarize') as record:
+        summary = summarize_log_data(args.input_dir, args.chunk_size, args.workers, args.top_k,
+                                     args.anomaly_frequency, stats=record)
+        cube = summary.to_cube()
+        save_aggregate_cube(cube, os.path.join(args.output_dir, CUBE_DIR))
+        record['rows_out'] = summary.transactions + summary.errors
+    print_summary(cube)
+    with instrumentation.stage('report'):
+        chart_report_stage(cube, args.output_dir, args.chart_workers)
+    instrumentation.write_summary(os.path.join(args.output_dir, f"summarize_{RUN_SUMMARY_FILE}"))
+
+
+def run_watch_command(args):
+    try:
+        watch(args.input_dir, args.output_dir, state_dir=args.state_dir, interval=args.interval,
+              refresh_seconds=args.refresh_seconds, max_iterations=args.max_iterations, chunk_size=args.chunk_size,
+              top_k=args.top_k, anomaly_frequency=args.anomaly_frequency, settle_seconds=args.settle_seconds,
+              chart_workers=args.chart_workers)
+    except KeyboardInterrupt:
+        print("Stopped watching; processed files are saved in the watch state")
+
+
+def run_query_command(args):
+    from sqlite_store import query_user
+
+    result = query_user(args.db_path, args.user_id)
+    if result['summary'].empty and result['timeline'].empty:
+        print(f"No records for user {args.user_id}")
+        return
+    if not result['summary'].empty:
+        print(result['summary'].iloc[0].to_string())
+    print("\nLosses by attributed transaction:")
+    print(result['losses'].to_string(index=False) if not result['losses'].empty else "No errors")
+    print("\nTimeline:")
+    print(result['timeline'].to_string(index=False))
+
+
+def _add_common_options(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Run each stage under cProfile and write the dumps to {PROFILE_DIR}/; only the main "
+                             f"process is profiled, not the --workers, --chart-workers or shard processes")
+
+
+def _add_parse_options(parser):
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Stream each .gz file line by line, parsing this many log entries per chunk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to parse log files in parallel")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Incremental mode: reuse parsed rows of unchanged files cached in this directory")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap decompression and parsing: reader threads feed chunks to --workers parsers")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS,
+                        help="Number of threads decompressing files in pipeline mode")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Chunks buffered between pipeline stages (default: twice --workers)")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default=None,
+                        help="Drop log entries repeated across files, tracked exactly or in a fixed-size Bloom filter")
+    parser.add_argument("--bloom-capacity", type=int, default=DEFAULT_BLOOM_CAPACITY,
+                        help="Distinct entries the --dedup bloom filter is sized for; its memory stays fixed")
+    parser.add_argument("--since", type=parse_time_bound, default=None,
+                        help="Only keep log entries at or after this time (ISO 8601, UTC unless a timezone is given)")
+    parser.add_argument("--until", type=parse_time_bound, default=None,
+                        help="Only keep log entries before this time")
+    parser.add_argument("--time-index", default=None,
+                        help=f"Per-file timestamp index used to skip files outside --since/--until "
+                             f"(default: {TIME_INDEX_FILE} in the artifacts or output directory)")
+
+
+def _add_analyze_options(parser):
+    parser.add_argument("--user-engine", choices=["vectorized", "loop"], default="vectorized",
+                        help="User analysis implementation: grouped joins (default) or the per-user loop")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Split the user analysis by userId hash into this many shards analyzed in parallel")
+    _add_anomaly_options(parser)
+
+
+def _add_anomaly_options(parser):
+    parser.add_argument("--anomaly-frequency", choices=list(FREQUENCIES), default=DEFAULT_FREQUENCY,
+                        help="Bucket size of the error rate anomaly detection")
+
+
+def _add_report_options(parser):
+    parser.add_argument("--parquet", action="store_true",
+                        help="Also export transactions, errors and user analysis as date-partitioned Parquet")
+    parser.add_argument("--chart-workers", type=int, default=1,
+                        help="Number of processes used to render PNG charts in parallel")
+    parser.add_argument("--chart-format", choices=["png", "native"], default="png",
+                        help="Embed 300 dpi PNG charts (default) or native Excel charts built from the aggregates")
+    parser.add_argument("--sqlite", default=None,
+                        help="Also write transactions, errors and user analysis to this SQLite file for `query`")
+
+
+def build_arg_parser():
     parser = argparse.ArgumentParser(description="Generate balance sync analytics reports.")
-    parser.add_argument("input_dir", help="Directory containing log files")
-    parser.add_argument("output_dir", help="Directory to write reports to")
-    args = parser.parse_args()
-    main(args.input_dir, args.output_dir)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parse_parser = subparsers.add_parser("parse", help="Parse log files into transaction and error artifacts")
+    parse_parser.add_argument("input_dir", help="Directory containing log files")
+    parse_parser.add_argument("artifacts_dir", help="Directory to write intermediate artifacts to")
+    _add_parse_options(parse_parser)
+    parse_parser.add_argument("--shards", type=int, default=1,
+                              help="Also write the artifacts partitioned by userId hash into this many shards, so "
+                                   "each `analyze --shard` job reads only its own rows")
+    _add_common_options(parse_parser)
+    parse_parser.set_defaults(func=run_parse_command)
+
+    analyze_parser = subparsers.add_parser("analyze", help="Run user analysis and aggregates on parsed artifacts")
+    analyze_parser.add_argument("artifacts_dir", help="Directory containing parsed artifacts")
+    _add_analyze_options(analyze_parser)
+    analyze_parser.add_argument("--shard", type=int, default=None,
+                                help="Only analyze this shard of --shards and write it to user_analysis_shards/")
+    analyze_parser.add_argument("--merge-shards", action="store_true",
+                                help="Merge the shards written by --shard jobs instead of analyzing")
+    _add_common_options(analyze_parser)
+    analyze_parser.set_defaults(func=run_analyze_command)
+
+    report_parser = subparsers.add_parser("report", help="Write the Excel report and charts from artifacts")
+    report_parser.add_argument("artifacts_dir", help="Directory containing analyzed artifacts")
+    report_parser.add_argument("output_dir", help="Directory to write reports to")
+    _add_report_options(report_parser)
+    _add_common_options(report_parser)
+    report_parser.set_defaults(func=run_report_command)
+
+    all_parser = subparsers.add_parser("all", help="Run the whole pipeline in memory (default)")
+    all_parser.add_argument("input_dir", help="Directory containing log files")
+    all_parser.add_argument("output_dir", help="Directory to write reports to")
+    _add_parse_options(all_parser)
+    _add_analyze_options(all_parser)
+    _add_report_options(all_parser)
+    _add_common_options(all_parser)
+    all_parser.set_defaults(func=run_all_command)
+
+    summarize_parser = subparsers.add_parser(
+        "summarize", help="Stream the logs into bounded-memory summaries and draw the daily and top-N charts")
+    summarize_parser.add_argument("input_dir", help="Directory containing log files")
+    summarize_parser.add_argument("output_dir", help="Directory to write the summary cube and charts to")
+    summarize_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                                  help="Number of log entries parsed and folded at a time")
+    summarize_parser.add_argument("--workers", type=int, default=1,
+                                  help="Number of processes summarizing log files in parallel")
+    summarize_parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                                  help="Number of users and actions tracked by the heavy hitter sketches")
+    summarize_parser.add_argument("--chart-workers", type=int, default=1,
+                                  help="Number of processes used to render PNG charts in parallel")
+    _add_anomaly_options(summarize_parser)
+    _add_common_options(summarize_parser)
+    summarize_parser.set_defaults(func=run_summarize_command)
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Poll for new log files and keep running aggregates and the report up to date")
+    watch_parser.add_argument("input_dir", help="Directory to poll for log files")
+    watch_parser.add_argument("output_dir", help="Directory to write reports to")
+    watch_parser.add_argument("--state-dir", default=None,
+                              help="Directory for the persisted running aggregates (default: <output_dir>/watch_state)")
+    watch_parser.add_argument("--interval", type=float, default=60,
+                              help="Seconds between polls of the input directory")
+    watch_parser.add_argument("--refresh-seconds", type=float, default=300,
+                              help="Minimum seconds between refreshes of the report")
+    watch_parser.add_argument("--max-iterations", type=int, default=None,
+                              help="Stop after this many polls (default: run until interrupted)")
+    watch_parser.add_argument("--settle-seconds", type=float, default=5,
+                              help="Only read files that have not been modified for this many seconds")
+    watch_parser.add_argument("--chunk-size", type=int, default=None,
+                              help="Stream each new file, parsing this many log entries per chunk")
+    watch_parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                              help="Number of users and actions tracked by the heavy hitter sketches")
+    watch_parser.add_argument("--chart-workers", type=int, default=1,
+                              help="Number of processes used to render PNG charts in parallel")
+    _add_anomaly_options(watch_parser)
+    watch_parser.set_defaults(func=run_watch_command)
+
+    query_parser = subparsers.add_parser("query", help="Show one user's timeline and losses from a --sqlite store")
+    query_parser.add_argument("db_path", help="SQLite file written with --sqlite")
+    query_parser.add_argument("user_id", help="userId to look up")
+    query_parser.set_defaults(func=run_query_command)
+
+    return parser
+
+
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Keep `run_reports.py <input_dir> <output_dir>` working as an alias for `all`
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith('-'):
+        argv = ['all'] + argv
+    args = build_arg_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,67 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# The one timestamp representation of every parsed frame
+TIMESTAMP_DTYPE = 'datetime64[ns, UTC]'
+
+# Low-cardinality text is stored as categoricals. Amounts and balances are integers in the logs but
+# any of them can be missing, so they use the nullable fixed-width integer type.
+TRANSACTION_DTYPES = {
+    'type': 'category',
+    'source': 'category',
+    'action': 'category',
+    'userId': 'category',
+    'paymentBalance': 'Int64',
+    'updatePaymentBalance': 'boolean',
+    'metadata': 'category',
+    'currency': 'category',
+    'amount': 'Int64',
+    'vat': 'Int64',
+    'oldBalance': 'Int64',
+    'newBalance': 'Int64',
+    'timestamp': TIMESTAMP_DTYPE,
+}
+
+ERROR_DTYPES = {
+    'userId': 'category',
+    'subscriptionBalance': 'float64',
+    'paymentBalance': 'float64',
+    'timestamp': TIMESTAMP_DTYPE,
+}
+
+
+def apply_schema(df, dtypes):
+    """Cast the columns of a parsed frame to their schema dtypes, parsing timestamps only if needed"""
+    casts = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == TIMESTAMP_DTYPE and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], utc=True)
+        casts[column] = dtype
+    return df.astype(casts) if casts else df
+
+
+def concat_categoricals(frames, combined):
+    """Restore the categorical columns of frames in combined, their concatenation.
+
+    concat keeps a categorical only when all frames share its categories; otherwise the column
+    falls back to plain values and is re-encoded here with the union of the categories.
+    """
+    for column in frames[0].columns:
+        if not isinstance(frames[0][column].dtype, pd.CategoricalDtype) or \
+                isinstance(combined[column].dtype, pd.CategoricalDtype):
+            continue
+        if all(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            combined[column] = pd.Series(union_categoricals([df[column] for df in frames], sort_categories=True),
+                                         index=combined.index)
+        else:
+            combined[column] = combined[column].astype('category')
+    return combined
+
+
+def plain_values(values):
+    """The values of a categorical Series in the dtype of its categories; other Series unchanged"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(values.cat.categories.dtype)
+    return values
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from request_index import build_request_index
+from user_analysis import analyze_all_users, analyze_all_users_vectorized
+
+USER_ENGINES = {'vectorized': analyze_all_users_vectorized, 'loop': analyze_all_users}
+SHARD_DIR = 'user_analysis_shards'
+SHARD_PARTITION_DIR = 'shard_partitions'
+SHARD_TABLES = ['errors', 'transactions', 'request_index']
+PARTITION_FINGERPRINT_FILE = 'fingerprint.json'
+
+# Fixed 16 character key, so every process and node assigns a user to the same shard
+SHARD_HASH_KEY = 'calo-user-shards'
+
+
+def user_shards(user_ids, shards):
+    """Shard number of each userId"""
+    user_ids = pd.Series(user_ids, dtype=object).fillna('')
+    hashes = hash_pandas_object(user_ids, index=False, hash_key=SHARD_HASH_KEY).to_numpy()
+    return (hashes % np.uint64(shards)).astype(np.int64)
+
+
+def select_shard(error_df, parsed_df, request_index, shard, shards):
+    """The errors, transactions and request_id index entries of the users in one shard.
+
+    The index is the one built from all transactions, split by the user of each indexed transaction.
+    A lookup only matches a transaction of the error's own user, so every error of the shard finds
+    the same transaction as in a single-process run. The errors keep their index labels, which
+    give the order the merged results are put back in.
+    """
+    errors = error_df.reset_index(drop=True)
+    errors = errors[user_shards(errors['userId'], shards) == shard]
+    transactions = parsed_df[user_shards(parsed_df['userId'], shards) == shard]
+    index = request_index[user_shards(request_index['userId'], shards) == shard]
+    return errors, transactions, index
+
+
+def split_shards(error_df, parsed_df, request_index, shards):
+    """select_shard for every shard, hashing each userId once"""
+    errors = error_df.reset_index(drop=True)
+    frames = [(df, user_shards(df['userId'], shards)) for df in (errors, parsed_df, request_index)]
+    return [tuple(df[shard_ids == shard] for df, shard_ids in frames) for shard in range(shards)]
+
+
+def analyze_shard_frames(errors, transactions, request_index, user_engine='vectorized'):
+    """Analyze the users of one shard; error_position records where each user first has an error"""
+    result = USER_ENGINES[user_engine](errors, transactions, request_index)
+    if result.empty:
+        return result
+    first_positions = errors.index.to_series().groupby(errors['userId'].to_numpy(), dropna=False).min()
+    result['error_position'] = first_positions.reindex(result['UserId']).to_numpy()
+    return result
+
+
+def analyze_shard(error_df, parsed_df, shard, shards, user_engine='vectorized', request_index=None):
+    if request_index is None:
+        request_index = build_request_index(parsed_df)
+    return analyze_shard_frames(*select_shard(error_df, parsed_df, request_index, shard, shards), user_engine)
+
+
+def merge_shard_results(results):
+    """Combine per-shard results into the table a single-process run produces"""
+    non_empty = [result for result in results if not result.empty]
+    if not non_empty:
+        return results[0] if results else pd.DataFrame()
+    merged = pd.concat(non_empty, ignore_index=True).sort_values('error_position', kind='mergesort')
+    return merged.drop(columns='error_position').reset_index(drop=True)
+
+
+def analyze_sharded(error_df, parsed_df, shards, user_engine='vectorized', request_index=None, workers=None):
+    """User analysis split into shards by userId hash, analyzed in a pool of processes and merged"""
+    if request_index is None:
+        request_index = build_request_index(parsed_df)
+    shard_frames = split_shards(error_df, parsed_df, request_index, shards)
+    with ProcessPoolExecutor(max_workers=workers or shards) as executor:
+        futures = [executor.submit(analyze_shard_frames, *frames, user_engine) for frames in shard_frames]
+        return merge_shard_results([future.result() for future in futures])
+
+
+def shard_path(artifacts_dir, shard, shards):
+    return os.path.join(artifacts_dir, SHARD_DIR, f"shard-{shard:04d}-of-{shards:04d}.parquet")
+
+
+def write_shard_result(result, artifacts_dir, shard, shards):
+    """Store one shard's result, e.g. from a job on one node of a shared filesystem"""
+    os.makedirs(os.path.join(artifacts_dir, SHARD_DIR), exist_ok=True)
+    result.to_parquet(shard_path(artifacts_dir, shard, shards), index=False)
+
+
+def read_shard_results(artifacts_dir, shards):
+    """Merge the stored results of all shards; fails if a shard has not been written yet"""
+    paths = [shard_path(artifacts_dir, shard, shards) for shard in range(shards)]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing user analysis shards: {', '.join(missing)}")
+    return merge_shard_results([pd.read_parquet(path) for path in paths])
+
+
+def partition_path(artifacts_dir, table, shard, shards):
+    return os.path.join(artifacts_dir, SHARD_PARTITION_DIR, f"shards-{shards:04d}", table, f"shard={shard}",
+                        "part-0.parquet")
+
+
+def artifacts_fingerprint(artifact_paths):
+    """Size and mtime of each artifact, which change whenever parse rewrites it"""
+    return [[os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in artifact_paths]
+
+
+def remove_shard_outputs(artifacts_dir):
+    """Drop the partitions and shard results derived from the previous artifacts"""
+    for name in (SHARD_PARTITION_DIR, SHARD_DIR):
+        shutil.rmtree(os.path.join(artifacts_dir, name), ignore_errors=True)
+
+
+def write_shard_partitions(error_df, parsed_df, request_index, artifacts_dir, shards, artifact_paths):
+    """Store the parsed artifacts as datasets partitioned by user shard, one directory per shard.
+
+    An `analyze --shard` job then reads only its own users' rows. Errors keep their position in
+    error_df as the error_position index, which orders the merged results. The fingerprint of the
+    artifacts at artifact_paths is stored with the partitions, so they are only used with the
+    artifacts they were split from.
+    """
+    for shard, frames in enumerate(split_shards(error_df, parsed_df, request_index, shards)):
+        errors, transactions, index = frames
+        for table, df in zip(SHARD_TABLES, (errors.rename_axis('error_position'), transactions, index)):
+            path = partition_path(artifacts_dir, table, shard, shards)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path, index=table != 'transactions')
+    fingerprint_path = os.path.join(artifacts_dir, SHARD_PARTITION_DIR, f"shards-{shards:04d}",
+                                    PARTITION_FINGERPRINT_FILE)
+    with open(fingerprint_path, 'w') as f:
+        json.dump(artifacts_fingerprint(artifact_paths), f)
+
+
+def read_shard_partition(artifacts_dir, shard, shards, artifact_paths):
+    """The (errors, transactions, request_index) of one shard.
+
+    None if parse did not partition into this many shards, or if the partitions were split from
+    other artifacts than the ones at artifact_paths.
+    """
+    fingerprint_path = os.path.join(artifacts_dir, SHARD_PARTITION_DIR, f"shards-{shards:04d}",
+                                    PARTITION_FINGERPRINT_FILE)
+    paths = [partition_path(artifacts_dir, table, shard, shards) for table in SHARD_TABLES]
+    if not all(os.path.exists(path) for path in paths + [fingerprint_path] + list(artifact_paths)):
+        return None
+    with open(fingerprint_path) as f:
+        if json.load(f) != artifacts_fingerprint(artifact_paths):
+            return None
+    errors, transactions, request_index = (pd.read_parquet(path) for path in paths)
+    return errors.rename_axis(None), transactions, request_index
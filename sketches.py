@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+# hash_pandas_object takes 16 character keys; two independent hashes give every Count-Min row its bucket
+HASH_KEYS = ('0123456789123456', 'calo-sketch-salt')
+
+
+def _hash(items, key=HASH_KEYS[0]):
+    return hash_pandas_object(pd.Series(items, dtype=object), index=False, hash_key=key).to_numpy()
+
+
+def _bit_length(values):
+    """Vectorized int.bit_length for uint64 arrays"""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        large = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[large] += shift
+        values[large] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters: the capacity most frequent items with overestimated counts.
+
+    Each count exceeds the true count by at most the item's error. While fewer than capacity
+    distinct items have been seen, counts are exact. Summaries merge by adding counts, with an
+    item missing from a full summary assumed to have that summary's minimum count.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.errors = pd.Series(dtype='int64')
+
+    def to_dict(self):
+        return {
+            'capacity': self.capacity,
+            'items': self.counts.index.tolist(),
+            'counts': self.counts.tolist(),
+            'errors': self.errors.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data['capacity'])
+        summary.counts = pd.Series(data['counts'], index=pd.Index(data['items'], dtype=object), dtype='int64')
+        summary.errors = pd.Series(data['errors'], index=summary.counts.index, dtype='int64')
+        return summary
+
+    def floor(self):
+        """Largest count an item that is not tracked can have"""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def add(self, counts):
+        """Fold exact per-item counts (e.g. the value_counts of a chunk) into the summary"""
+        self._combine(counts, pd.Series(0, index=counts.index, dtype='int64'), 0)
+
+    def merge(self, other):
+        self._combine(other.counts, other.errors, other.floor())
+
+    def _combine(self, counts, errors, floor):
+        own_floor = self.floor()
+        items = self.counts.index.union(counts.index)
+        merged = self.counts.reindex(items, fill_value=own_floor) + counts.reindex(items, fill_value=floor)
+        merged_errors = self.errors.reindex(items, fill_value=own_floor) + errors.reindex(items, fill_value=floor)
+        top = merged.sort_values(ascending=False, kind='mergesort').head(self.capacity)
+        self.counts = top.astype('int64')
+        self.errors = merged_errors[top.index].astype('int64')
+
+
+class CountMinSketch:
+    """Count-Min sketch: per-item count estimates that never undercount, in depth x width counters"""
+
+    def __init__(self, width=2048, depth=4):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def to_dict(self):
+        return {'table': self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.table = np.array(data['table'], dtype=np.int64)
+        return sketch
+
+    def _buckets(self, items):
+        depth, width = self.table.shape
+        first, second = _hash(items, HASH_KEYS[0]), _hash(items, HASH_KEYS[1]) | np.uint64(1)
+        rows = np.arange(depth, dtype=np.uint64)[:, None]
+        return ((first[None, :] + rows * second[None, :]) % np.uint64(width)).astype(np.intp)
+
+    def add(self, counts):
+        buckets = self._buckets(counts.index)
+        for row in range(self.table.shape[0]):
+            np.add.at(self.table[row], buckets[row], counts.to_numpy(dtype=np.int64))
+
+    def estimate(self, items):
+        if len(items) == 0:
+            return np.zeros(0, dtype=np.int64)
+        buckets = self._buckets(items)
+        return self.table[np.arange(self.table.shape[0])[:, None], buckets].min(axis=0)
+
+    def merge(self, other):
+        if other.table.shape != self.table.shape:
+            raise ValueError("Count-Min sketches of different sizes cannot be merged")
+        self.table += other.table
+
+
+class HyperLogLog:
+    """HyperLogLog distinct count with 2**precision one-byte registers (about 1% error at 14)"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': self.registers.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'])
+        sketch.registers = np.array(data['registers'], dtype=np.uint8)
+        return sketch
+
+    def add(self, items):
+        if len(items) == 0:
+            return
+        hashes = _hash(items)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        rank = suffix_bits + 1 - _bit_length(hashes & np.uint64((1 << suffix_bits) - 1))
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def count(self):
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog sketches of different precision cannot be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+
+class HeavyHitters:
+    """Space-Saving candidates with Count-Min estimates, for top-N counts in bounded memory"""
+
+    def __init__(self, capacity=1000, width=2048, depth=4):
+        self.candidates = SpaceSaving(capacity)
+        self.sketch = CountMinSketch(width, depth)
+
+    def to_dict(self):
+        return {'candidates': self.candidates.to_dict(), 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        heavy_hitters = cls()
+        heavy_hitters.candidates = SpaceSaving.from_dict(data['candidates'])
+        heavy_hitters.sketch = CountMinSketch.from_dict(data['sketch'])
+        return heavy_hitters
+
+    def add(self, counts):
+        counts = counts[counts.index.notna()]
+        self.candidates.add(counts)
+        self.sketch.add(counts)
+
+    def merge(self, other):
+        self.candidates.merge(other.candidates)
+        self.sketch.merge(other.sketch)
+
+    def top(self, n=None):
+        """The n most frequent items, each counted by the tighter of its two overestimates"""
+        items = self.candidates.counts.index
+        estimates = pd.Series(np.minimum(self.candidates.counts.to_numpy(), self.sketch.estimate(items)),
+                              index=items)
+        estimates = estimates.sort_values(ascending=False, kind='mergesort')
+        return estimates if n is None else estimates.head(n)
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit hashes: fixed memory, no false negatives, about error_rate false positives.
+
+    Sized for capacity items; its two 32-bit halves give every hash its bit positions. Beyond
+    capacity items the false positive rate grows, but the memory does not.
+    """
+
+    def __init__(self, capacity=10_000_000, error_rate=0.001):
+        self.size = max(64, int(np.ceil(-capacity * np.log(error_rate) / np.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * np.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first, second = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        rounds = np.arange(self.hash_count, dtype=np.uint64)[:, None]
+        positions = (first[None, :] + rounds * second[None, :]) % np.uint64(self.size)
+        return positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+
+    def contains(self, hashes):
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=bool)
+        index, mask = self._positions(hashes)
+        return (self.bits[index] & mask).all(axis=0)
+
+    def add(self, hashes):
+        index, mask = self._positions(hashes)
+        np.bitwise_or.at(self.bits, index.ravel(), mask.ravel())
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+
+import pandas as pd
+
+from user_analysis import attribute_errors
+
+STORE_BATCH_SIZE = 100_000
+
+TRANSACTIONS_TABLE = 'transactions'
+ERRORS_TABLE = 'errors'
+USER_ANALYSIS_TABLE = 'user_wise_error_analysis_data'
+
+# Indexed columns of each table; user analysis has one row per user
+TABLE_INDEXES = {
+    TRANSACTIONS_TABLE: ['userId', 'request_id', 'timestamp'],
+    ERRORS_TABLE: ['userId', 'request_id', 'timestamp'],
+    USER_ANALYSIS_TABLE: ['UserId'],
+}
+
+# Timestamps are stored as fixed-width UTC text, so they sort and compare in time order
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+TIMELINE_QUERY = f"""
+SELECT timestamp, 'transaction' AS record, request_id, type, action, source, amount, oldBalance, newBalance,
+       NULL AS subscriptionBalance, NULL AS paymentBalance, NULL AS loss
+FROM {TRANSACTIONS_TABLE} WHERE userId = :user_id
+UNION ALL
+SELECT timestamp, 'error', request_id, type, action, source, NULL, NULL, NULL,
+       subscriptionBalance, paymentBalance, loss
+FROM {ERRORS_TABLE} WHERE userId = :user_id
+ORDER BY timestamp, record DESC
+"""
+
+LOSS_BREAKDOWN_QUERY = f"""
+SELECT CASE WHEN matched THEN type ELSE 'Unknown' END AS type, CASE WHEN matched THEN action END AS action,
+       COUNT(*) AS errors, TOTAL(loss) AS loss
+FROM {ERRORS_TABLE} WHERE userId = :user_id
+GROUP BY 1, 2
+ORDER BY loss DESC, type, action
+"""
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _sql_values(df):
+    """The columns of df as Python values sqlite3 can bind, with None for missing values"""
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(TIMESTAMP_FORMAT)
+    return df.astype(object).where(df.notna(), None)
+
+
+def _insert_table(connection, name, df, batch_size):
+    columns = ', '.join(f'"{column}" {_sql_type(df[column].dtype)}' for column in df.columns)
+    connection.execute(f'CREATE TABLE "{name}" ({columns})')
+    insert = f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(df.columns))})'
+    for start in range(0, len(df), batch_size):
+        # One transaction per batch instead of one per row
+        rows = _sql_values(df.iloc[start:start + batch_size]).itertuples(index=False, name=None)
+        with connection:
+            connection.executemany(insert, rows)
+    for column in TABLE_INDEXES[name]:
+        connection.execute(f'CREATE INDEX "{name}_{column}" ON "{name}" ("{column}")')
+
+
+def write_store(db_path, parsed_df, error_df, user_analysis_df, request_index=None, batch_size=STORE_BATCH_SIZE):
+    """Write the transactions, errors and user analysis to a new SQLite database at db_path.
+
+    Errors are stored with their loss and the type, action and source of the transaction they are
+    attributed to, so per-user loss breakdowns need no join. The database is built next to db_path
+    and moved into place, so readers never see a partial store.
+    """
+    errors = attribute_errors(error_df, parsed_df, request_index).sort_index()
+    errors['matched'] = errors['matched'].astype(bool)
+    tables = {
+        TRANSACTIONS_TABLE: parsed_df,
+        ERRORS_TABLE: errors,
+        USER_ANALYSIS_TABLE: user_analysis_df,
+    }
+
+    temp_path = db_path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        # A crash leaves only the temporary file behind, so the load can skip syncing
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA journal_mode = OFF')
+        for name, df in tables.items():
+            _insert_table(connection, name, df, batch_size)
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+
+
+def query_user(db_path, user_id):
+    """One user's summary row, loss breakdown by attributed transaction type and action, and timeline"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"No SQLite store at {db_path}")
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    params = {'user_id': user_id}
+    try:
+        return {
+            'summary': pd.read_sql_query(f'SELECT * FROM {USER_ANALYSIS_TABLE} WHERE UserId = :user_id',
+                                         connection, params=params),
+            'losses': pd.read_sql_query(LOSS_BREAKDOWN_QUERY, connection, params=params),
+            'timeline': pd.read_sql_query(TIMELINE_QUERY, connection, params=params),
+        }
+    finally:
+        connection.close()
@@ -0,0 +1,83 @@
+import json
+import os
+
+import pandas as pd
+
+TIME_INDEX_FILE = 'time_index.json'
+
+
+def parse_time_bound(value):
+    """A --since/--until value as a UTC Timestamp; values without a timezone are taken as UTC"""
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+
+def select_time_range(df, since=None, until=None):
+    """The rows of a parsed frame with a timestamp at or after since and before until"""
+    if df.empty or (since is None and until is None):
+        return df
+    keep = df['timestamp'].notna()
+    if since is not None:
+        keep &= df['timestamp'] >= since
+    if until is not None:
+        keep &= df['timestamp'] < until
+    return df if keep.all() else df[keep].reset_index(drop=True)
+
+
+class TimeIndex:
+    """Earliest and latest transaction or error timestamp of each log file, persisted as JSON.
+
+    Like the ParseCache manifest, entries are keyed by absolute path and dropped when a file's size
+    or mtime changes. Only transactions and errors are covered, since no report reads other entries;
+    a file without any has no bounds and is never in a range.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.files = json.load(f)
+        else:
+            self.files = {}
+
+    def bounds(self, file_path):
+        """(first, last) timestamps of file_path, (None, None) if it has no rows, or None if not indexed"""
+        entry = self.files.get(os.path.abspath(file_path))
+        stat = os.stat(file_path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            return None
+        if entry['first'] is None:
+            return None, None
+        return pd.Timestamp(entry['first']), pd.Timestamp(entry['last'])
+
+    def select(self, file_paths, since=None, until=None):
+        """Split file_paths into the files that can have rows in [since, until) and those of them not indexed yet"""
+        selected, unindexed = [], []
+        for file_path in file_paths:
+            bounds = self.bounds(file_path)
+            if bounds is None:
+                selected.append(file_path)
+                unindexed.append(file_path)
+            elif bounds[0] is not None and (until is None or bounds[0] < until) and \
+                    (since is None or bounds[1] >= since):
+                selected.append(file_path)
+        return selected, unindexed
+
+    def record(self, file_path, parsed_df, error_df):
+        """Index a file from all of its parsed transaction and error rows"""
+        # A file without any rows parses into frames without columns
+        columns = [df['timestamp'].dropna() for df in (parsed_df, error_df) if 'timestamp' in df.columns]
+        timestamps = pd.concat(columns) if columns else pd.Series(dtype=object)
+        stat = os.stat(file_path)
+        self.files[os.path.abspath(file_path)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'first': timestamps.min().isoformat() if len(timestamps) else None,
+            'last': timestamps.max().isoformat() if len(timestamps) else None,
+        }
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.files, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
@@ -1,18 +1,23 @@
+import numpy as np
 import pandas as pd
 
+from request_index import build_request_index, lookup_transaction, lookup_transactions
+from schema import plain_values
 
-def analyze_user_data(user_id, error_data, parsed_transactions):
+# Print progress every this many users instead of once per user
+PROGRESS_INTERVAL = 1000
+
+
+def analyze_user_data(user_id, error_data, parsed_transactions, request_index=None):
     # Filter data for the user
     user_error_data = error_data[error_data['userId'] == user_id].copy()
     user_transactions = parsed_transactions[parsed_transactions['userId'] == user_id].copy()
+    if request_index is None:
+        request_index = build_request_index(user_transactions)
 
-    # Convert timestamp columns to datetime
-    user_error_data['timestamp'] = pd.to_datetime(user_error_data['timestamp'])
-    user_transactions['timestamp'] = pd.to_datetime(user_transactions['timestamp'])
-
-    # Sort by timestamp
-    user_error_data = user_error_data.sort_values('timestamp')
-    user_transactions = user_transactions.sort_values('timestamp')
+    # Sort by timestamp (stable, so ties keep log order)
+    user_error_data = user_error_data.sort_values('timestamp', kind='mergesort')
+    user_transactions = user_transactions.sort_values('timestamp', kind='mergesort')
 
     # Calculate analysis metrics
     first_error_transaction = user_error_data.iloc[0] if len(user_error_data) > 0 else None
@@ -33,10 +38,10 @@ def analyze_user_data(user_id, error_data, parsed_transactions):
     # Match error records with parsed transactions to get type-specific losses
     for _, error_row in user_error_data.iterrows():
         # Find matching transaction by request_id
-        matching_transaction = user_transactions[user_transactions['request_id'] == error_row['request_id']]
+        matching_transaction = lookup_transaction(request_index, error_row['request_id'], user_id)
 
-        if not matching_transaction.empty:
-            transaction_type = matching_transaction.iloc[0]['type']
+        if matching_transaction is not None:
+            transaction_type = matching_transaction['type']
             loss_amount = error_row['loss'] if pd.notna(error_row['loss']) else 0
 
             if transaction_type == 'DEBIT':
@@ -65,12 +70,11 @@ def analyze_user_data(user_id, error_data, parsed_transactions):
     first_error_reason = "Unknown"
     if first_error_transaction is not None:
         # Find the corresponding transaction in parsed data using request_id
-        matching_transaction = user_transactions[
-            user_transactions['request_id'] == first_error_transaction['request_id']]
-        if not matching_transaction.empty:
+        matching_transaction = lookup_transaction(request_index, first_error_transaction['request_id'], user_id)
+        if matching_transaction is not None:
             # Get the action and source from the matching transaction
-            action = matching_transaction.iloc[0]['action']
-            source = matching_transaction.iloc[0]['source']
+            action = matching_transaction['action']
+            source = matching_transaction['source']
             first_error_reason = f"{source} - {action}"
         else:
             # If no exact match, try to find by timestamp (within a small window)
@@ -102,16 +106,19 @@ def analyze_user_data(user_id, error_data, parsed_transactions):
     return analysis_result
 
 
-def analyze_all_users(error_df, parsed_df):
+def analyze_all_users(error_df, parsed_df, request_index=None):
     unique_users = error_df['userId'].unique()
     print(f"Total unique users in error data: {len(unique_users)}")
+    if request_index is None:
+        request_index = build_request_index(parsed_df)
     all_results = []
 
     for i, user_id in enumerate(unique_users):
-        print(f"Analyzing user {i + 1}/{len(unique_users)}: {user_id}")
+        if (i + 1) % PROGRESS_INTERVAL == 0 or i + 1 == len(unique_users):
+            print(f"Analyzing user {i + 1}/{len(unique_users)}: {user_id}")
 
         try:
-            result = analyze_user_data(user_id, error_df, parsed_df)
+            result = analyze_user_data(user_id, error_df, parsed_df, request_index)
             all_results.append(result)
         except Exception as e:
             print(f"Error analyzing user {user_id}: {e}")
@@ -130,3 +137,192 @@ def analyze_all_users(error_df, parsed_df):
     result_df = pd.DataFrame(all_results)
     print(f"\nAnalysis completed for all {len(unique_users)} users")
     return result_df
+
+
+def _resolve_error_transactions(errors, transactions, request_index):
+    """Attach the type, action and source of the transaction each error row is attributed to.
+
+    Mirrors analyze_user_data: the indexed transaction of the error's request_id wins if it belongs
+    to the same user, otherwise the earliest transaction of the user within 5 seconds of the error
+    is used.
+    """
+    fields = ['type', 'action', 'source']
+
+    by_request = lookup_transactions(request_index, errors['request_id'], errors['userId'])
+    # Plain values, so fields of transactions outside the index can be filled in below
+    resolved = errors.join(by_request[fields].astype(object))
+    matched = by_request['matched']
+
+    unmatched = resolved.loc[~matched & resolved['timestamp'].notna(), ['userId', 'timestamp']]
+    candidates = transactions.dropna(subset=['userId', 'timestamp'])
+    if not unmatched.empty and not candidates.empty:
+        time_window = pd.Timedelta(seconds=5)
+        unmatched = unmatched.assign(userId=unmatched['userId'].astype(object),
+                                     window_start=unmatched['timestamp'] - time_window)
+        unmatched = unmatched.sort_values('window_start', kind='mergesort')
+        candidates = candidates.assign(userId=candidates['userId'].astype(object))
+        by_time = pd.merge_asof(
+            unmatched.reset_index(),
+            candidates[['userId', 'timestamp'] + fields].rename(columns={'timestamp': 'transaction_timestamp'}),
+            left_on='window_start',
+            right_on='transaction_timestamp',
+            by='userId',
+            direction='forward',
+            tolerance=2 * time_window,
+        ).set_index('index')
+        by_time = by_time[by_time['transaction_timestamp'].notna()]
+        resolved.loc[by_time.index, fields] = by_time[fields]
+        matched.loc[by_time.index] = True
+
+    resolved['matched'] = matched
+    return resolved
+
+
+def attribute_errors(error_df, parsed_df, request_index=None):
+    """The error rows in timestamp order, with their loss and the transaction each is attributed to.
+
+    type, action and source are those of the attributed transaction; errors without one have
+    'matched' False and their loss counts towards neither loss total.
+    """
+    errors = error_df[['userId', 'request_id', 'timestamp', 'subscriptionBalance', 'paymentBalance']].copy()
+    errors['loss'] = abs(pd.to_numeric(errors['subscriptionBalance'], errors='coerce') -
+                         pd.to_numeric(errors['paymentBalance'], errors='coerce'))
+    errors = errors.sort_values('timestamp', kind='mergesort')
+
+    transactions = parsed_df[['userId', 'request_id', 'timestamp', 'type', 'action', 'source']]
+    transactions = transactions.sort_values('timestamp', kind='mergesort')
+
+    if request_index is None:
+        request_index = build_request_index(transactions)
+    return _resolve_error_transactions(errors, transactions, request_index)
+
+
+def analyze_all_users_vectorized(error_df, parsed_df, request_index=None):
+    """Vectorized analyze_all_users: one join and one sorted merge_asof instead of a scan per user"""
+    unique_users = np.asarray(error_df['userId'].unique())
+    print(f"Total unique users in error data: {len(unique_users)}")
+
+    resolved = attribute_errors(error_df, parsed_df, request_index)
+    user_index = pd.Index(unique_users)
+
+    losses = {}
+    for transaction_type, column in [('DEBIT', 'Total_debit_loss'), ('CREDIT', 'Total_credit_loss')]:
+        contributing = resolved[resolved['matched'] & (resolved['type'] == transaction_type)]
+        user_losses = contributing['loss'].fillna(0).groupby(contributing['userId'], observed=True).sum()
+        user_losses = user_losses.reindex(user_index, fill_value=0)
+        # analyze_user_data only turns a loss total into a float once a non-null loss is added
+        if contributing['loss'].notna().any():
+            losses[column] = user_losses.astype(float)
+        else:
+            losses[column] = user_losses.astype(int)
+
+    grouped_errors = resolved.groupby('userId', sort=False, observed=True)
+    first_errors = grouped_errors.head(1).set_index('userId').reindex(user_index)
+    last_errors = grouped_errors.tail(1).set_index('userId').reindex(user_index)
+
+    first_error_reason = [
+        f"{source} - {action}" if matched else "Unknown"
+        for source, action, matched in zip(first_errors['source'], first_errors['action'],
+                                           first_errors['matched'])
+    ]
+
+    result_df = pd.DataFrame({
+        'UserId': unique_users,
+        'First_error_transaction': first_errors['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(),
+        'Last_error_transaction': last_errors['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(),
+        'Total_transactions': parsed_df.groupby('userId', observed=True).size().reindex(user_index, fill_value=0)
+        .to_numpy(),
+        'Total_error_transactions': grouped_errors.size().reindex(user_index, fill_value=0).to_numpy(),
+        'Total_debit_loss': losses['Total_debit_loss'].to_numpy(),
+        'Total_credit_loss': losses['Total_credit_loss'].to_numpy(),
+        'First_error_transaction_reason': first_error_reason,
+    })
+    print(f"\nAnalysis completed for all {len(unique_users)} users")
+    return result_df
+
+
+USER_SUMMARY_COLUMNS = ['userId', 'Total_transactions', 'Total_error_transactions', 'Total_debit_loss',
+                        'Total_credit_loss', 'first_error', 'first_error_reason', 'last_error']
+
+
+def summarize_users(error_df, parsed_df, request_index=None, fallback_transactions=None):
+    """Per-user totals of one batch that can be added to the totals of earlier batches.
+
+    Covers every user with a transaction or an error. Errors are attributed to transactions like
+    analyze_all_users_vectorized. request_index may span earlier batches, and so may
+    fallback_transactions, the transactions searched by the 5 second timestamp fallback (by default
+    the transactions of this batch).
+    """
+    # Batches have different userId categories, so the totals are keyed by the plain values
+    errors = error_df[['userId', 'request_id', 'timestamp', 'subscriptionBalance', 'paymentBalance']].copy()
+    errors['userId'] = plain_values(errors['userId'])
+    errors['loss'] = abs(pd.to_numeric(errors['subscriptionBalance'], errors='coerce') -
+                         pd.to_numeric(errors['paymentBalance'], errors='coerce')).fillna(0)
+    errors = errors.sort_values('timestamp', kind='mergesort')
+
+    transactions = parsed_df[['userId', 'request_id', 'timestamp', 'type', 'action', 'source']].copy()
+    transactions['userId'] = plain_values(transactions['userId'])
+    transactions = transactions.sort_values('timestamp', kind='mergesort')
+
+    if request_index is None:
+        request_index = build_request_index(transactions)
+    if fallback_transactions is not None:
+        fallback_transactions = fallback_transactions[['userId', 'timestamp', 'type', 'action', 'source']]
+        fallback_transactions = fallback_transactions.sort_values('timestamp', kind='mergesort')
+    else:
+        fallback_transactions = transactions
+    resolved = _resolve_error_transactions(errors, fallback_transactions, request_index)
+    resolved['reason'] = [f"{source} - {action}" if matched else "Unknown"
+                          for source, action, matched in zip(resolved['source'], resolved['action'],
+                                                             resolved['matched'])]
+
+    grouped_errors = resolved.groupby('userId', sort=False)
+    first_errors = grouped_errors.head(1).set_index('userId')
+    summary = pd.DataFrame({
+        'Total_transactions': transactions.groupby('userId').size(),
+        'Total_error_transactions': grouped_errors.size(),
+        'Total_debit_loss': resolved['loss'].where(resolved['matched'] & (resolved['type'] == 'DEBIT'), 0)
+        .groupby(resolved['userId']).sum(),
+        'Total_credit_loss': resolved['loss'].where(resolved['matched'] & (resolved['type'] == 'CREDIT'), 0)
+        .groupby(resolved['userId']).sum(),
+        'first_error': first_errors['timestamp'],
+        'first_error_reason': first_errors['reason'],
+        'last_error': grouped_errors['timestamp'].max(),
+    })
+    for column in ['Total_transactions', 'Total_error_transactions']:
+        summary[column] = summary[column].fillna(0).astype('int64')
+    for column in ['Total_debit_loss', 'Total_credit_loss']:
+        summary[column] = summary[column].fillna(0).astype(float)
+    return summary.rename_axis('userId').reset_index()[USER_SUMMARY_COLUMNS]
+
+
+def merge_user_summaries(running, batch):
+    """Add a batch from summarize_users to the running per-user totals"""
+    if running is None or running.empty:
+        return batch.reset_index(drop=True)
+    combined = pd.concat([running, batch], ignore_index=True)
+    grouped = combined.groupby('userId', sort=False)
+    merged = grouped[['Total_transactions', 'Total_error_transactions', 'Total_debit_loss',
+                      'Total_credit_loss']].sum()
+    # The earliest error keeps its reason; on ties the running totals win
+    first = (combined.dropna(subset=['first_error']).sort_values('first_error', kind='mergesort')
+             .drop_duplicates('userId').set_index('userId'))
+    merged['first_error'] = first['first_error']
+    merged['first_error_reason'] = first['first_error_reason']
+    merged['last_error'] = grouped['last_error'].max()
+    return merged.reset_index()[USER_SUMMARY_COLUMNS]
+
+
+def user_analysis_from_summary(summary):
+    """The analyze_all_users table for the users with errors in the running totals, by first error"""
+    users = summary[summary['Total_error_transactions'] > 0].sort_values('first_error', kind='mergesort')
+    return pd.DataFrame({
+        'UserId': users['userId'].to_numpy(),
+        'First_error_transaction': users['first_error'].dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(),
+        'Last_error_transaction': users['last_error'].dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(),
+        'Total_transactions': users['Total_transactions'].to_numpy(),
+        'Total_error_transactions': users['Total_error_transactions'].to_numpy(),
+        'Total_debit_loss': users['Total_debit_loss'].to_numpy(),
+        'Total_credit_loss': users['Total_credit_loss'].to_numpy(),
+        'First_error_transaction_reason': users['first_error_reason'].to_numpy(),
+    })
@@ -0,0 +1,204 @@
+import json
+import os
+import time
+
+import pandas as pd
+
+from aggregates import CUBE_DIR, DEFAULT_TOP_K, StreamingSummary, build_aggregate_cube, save_aggregate_cube
+from anomalies import DEFAULT_FREQUENCY
+from ingest import combine_parsed, find_log_files, parse_log_file
+from reporting import USER_ANALYSIS_ARTIFACT, chart_report_stage, print_summary
+from request_index import build_request_index, lookup_transactions
+from schema import plain_values
+from user_analysis import merge_user_summaries, summarize_users, user_analysis_from_summary
+
+STATE_FILE = 'state.json'
+WATCH_STATE_DIR = 'watch_state'
+
+
+class WatchState:
+    """Running aggregates of every log file folded in so far, persisted in state_dir.
+
+    The files found by one poll are folded in as one batch. Their errors are attributed through the
+    request_id index of all files so far, so transactions logged in an earlier file still match; a
+    transaction that only arrives in a later poll is not matched retroactively.
+
+    state.json holds the processed files, the StreamingSummary (daily counts, top users, error rate
+    buckets) and the error counts per action. The per-user totals and the request_id index are
+    Parquet files tagged with a generation number. A save writes the next generation in full before
+    replacing state.json, so an interrupted save leaves the previous state intact and no file is
+    folded in twice. The totals cannot be taken back out, so a file is expected not to change once
+    it has been folded in; is_changed tells when it did.
+    """
+
+    def __init__(self, state_dir, top_k=DEFAULT_TOP_K, anomaly_frequency=DEFAULT_FREQUENCY):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, STATE_FILE)
+        self.generation = 0
+        self.files = {}
+        self.summary = StreamingSummary(top_k, anomaly_frequency)
+        self.error_actions = pd.Series(dtype='int64')
+        self.users = None
+        self.request_index = None
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.generation = state['generation']
+            self.files = state['files']
+            self.summary = StreamingSummary.from_dict(state['summary'])
+            self.error_actions = pd.Series(state['error_actions'], dtype='int64')
+            self.users = pd.read_parquet(self._table_path('users'))
+            self.request_index = pd.read_parquet(self._table_path('request_index'))
+
+    def _table_path(self, name, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.state_dir, f"{name}-{generation}.parquet")
+
+    def is_processed(self, file_path):
+        return file_path in self.files
+
+    def is_changed(self, file_path, stat):
+        """Whether a processed file has another size or mtime than when it was folded in"""
+        entry = self.files[file_path]
+        return entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime
+
+    def fold(self, file_stats, parsed_df, error_df):
+        """Add the parsed rows of a batch of new files to the running aggregates.
+
+        file_stats maps each file to its os.stat from before it was parsed, which is_changed compares against.
+        """
+        batch_index = build_request_index(parsed_df)
+        if self.request_index is None:
+            self.request_index = batch_index
+        elif batch_index.index.isin(self.request_index.index).any():
+            # A request_id seen before: rebuild so the earliest transaction still wins
+            self.request_index = build_request_index(
+                pd.concat([self.request_index.reset_index(), batch_index.reset_index()], ignore_index=True))
+        else:
+            self.request_index = pd.concat([self.request_index, batch_index])
+
+        # Indexed transactions of all files so far, plus this file's transactions without a request_id
+        fallback_transactions = pd.concat([self.request_index.reset_index(drop=True),
+                                           parsed_df[parsed_df['request_id'].isna()]], ignore_index=True)
+        batch_users = summarize_users(error_df, parsed_df, self.request_index, fallback_transactions)
+        self.users = merge_user_summaries(self.users, batch_users)
+        self.summary.update(parsed_df, error_df)
+        actions = lookup_transactions(self.request_index, error_df['request_id'])['action']
+        actions = plain_values(actions).value_counts()
+        self.error_actions = self.error_actions.add(actions, fill_value=0).astype('int64')
+        for file_path, stat in file_stats.items():
+            self.files[file_path] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def save(self):
+        generation = self.generation + 1
+        if self.users is not None:
+            self.users.to_parquet(self._table_path('users', generation), index=False)
+            self.request_index.to_parquet(self._table_path('request_index', generation))
+        state = {
+            'generation': generation,
+            'files': self.files,
+            'summary': self.summary.to_dict(),
+            'error_actions': {action: int(count) for action, count in self.error_actions.items()},
+        }
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+        for name in ['users', 'request_index']:
+            old_path = self._table_path(name)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        self.generation = generation
+
+    def user_analysis(self):
+        return user_analysis_from_summary(self.users)
+
+    def to_cube(self):
+        """The streaming summary cube completed with error actions, losses and first error reasons"""
+        cube = self.summary.to_cube()
+        error_actions = self.error_actions.sort_values(ascending=False, kind='mergesort')
+        cube['error_actions'] = pd.DataFrame({'action': error_actions.index.to_numpy(dtype=object),
+                                              'count': error_actions.to_numpy()})
+        if self.users is not None:
+            cube.update(build_aggregate_cube(user_analysis_df=self.user_analysis()))
+        return cube
+
+
+def _settled_stat(file_path, settle_seconds):
+    """os.stat of file_path, or None if it was removed since it was listed or is still being written"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        # Rotated or deleted between listing and stat; a new file is picked up by the next poll
+        return None
+    # A file still being written or copied keeps getting a newer mtime
+    return stat if time.time() - stat.st_mtime >= settle_seconds else None
+
+
+def refresh_outputs(state, output_dir, chart_workers=1):
+    """Rewrite the cube, user analysis and report from the running aggregates"""
+    os.makedirs(output_dir, exist_ok=True)
+    cube = state.to_cube()
+    user_analysis_df = state.user_analysis()
+    save_aggregate_cube(cube, os.path.join(output_dir, CUBE_DIR))
+    user_analysis_df.to_parquet(os.path.join(output_dir, USER_ANALYSIS_ARTIFACT), index=False)
+    print_summary(cube)
+    chart_report_stage(cube, output_dir, chart_workers, user_analysis_df=user_analysis_df)
+
+
+def watch(input_dir, output_dir, state_dir=None, interval=60, refresh_seconds=300, max_iterations=None,
+          chunk_size=None, top_k=DEFAULT_TOP_K, anomaly_frequency=DEFAULT_FREQUENCY, settle_seconds=5,
+          chart_workers=1):
+    """Poll input_dir, fold newly arrived .gz files into the persisted state and refresh the outputs.
+
+    Outputs are refreshed at most every refresh_seconds, and only when new files were folded in
+    since the last refresh. With max_iterations the loop stops after that many polls, refreshing
+    any pending changes first.
+    """
+    state = WatchState(state_dir or os.path.join(output_dir, WATCH_STATE_DIR), top_k, anomaly_frequency)
+    print(f"Watching {input_dir} ({len(state.files)} files already processed)")
+    pending_refresh = bool(state.files)
+    last_refresh = None
+    iteration = 0
+    reported_changes = set()
+
+    while True:
+        iteration += 1
+        last_iteration = max_iterations is not None and iteration >= max_iterations
+
+        new_files = {}
+        for file_path in find_log_files(input_dir):
+            stat = _settled_stat(file_path, settle_seconds)
+            if stat is None:
+                continue
+            if not state.is_processed(file_path):
+                new_files[file_path] = stat
+            elif state.is_changed(file_path, stat) and (file_path, stat.st_size, stat.st_mtime) not in reported_changes:
+                reported_changes.add((file_path, stat.st_size, stat.st_mtime))
+                print(f"Skipped {file_path}: changed after it was folded in; start a new --state-dir to include it")
+        folded = {}
+        for file_path in new_files:
+            print(f"Reading: {file_path}")
+            try:
+                folded[file_path] = parse_log_file(file_path, chunk_size)
+            except Exception as e:
+                # Retried on the next poll, in case the file was not complete yet or was removed
+                print(f"Failed to read {file_path}: {e}")
+        if folded:
+            state.fold({file_path: new_files[file_path] for file_path in folded},
+                       *combine_parsed(list(folded.values())))
+            state.save()
+            pending_refresh = True
+
+        refresh_due = last_refresh is None or time.monotonic() - last_refresh >= refresh_seconds
+        if pending_refresh and (refresh_due or last_iteration):
+            refresh_outputs(state, output_dir, chart_workers)
+            last_refresh = time.monotonic()
+            pending_refresh = False
+
+        if last_iteration:
+            break
+        time.sleep(interval)